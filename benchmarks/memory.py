@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Memory per resolved reference, with and without lean mode
+
+The references are parsed from the test responses (no network), the
+memory is measured with tracemalloc while the RefAPI objects are alive.
+
+usage: python benchmarks/memory.py [number of references]
+"""
+
+
+from refparse.parser import CrossRefParser, arXivParser
+from refparse.api import RefAPI
+import tracemalloc
+import logging
+import gc
+import os
+import sys
+
+TEST_PATH = os.path.join(os.path.dirname(__file__), "..", "tests")
+CASES = [
+    ("crossref", CrossRefParser, "10.1021/acs.jpcc.8b11783"),
+    ("arXiv", arXivParser, "hep-th/9901001v3"),
+]
+
+
+def read_test_file(name):
+    with open(os.path.join(TEST_PATH, name), "r") as f:
+        return f.read()
+
+
+def measure(parser_class, reference, text, count, lean):
+    """Return the traced memory per RefAPI object in bytes"""
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    apis = []
+    for _ in range(count):
+        # copy the text, as if every response was downloaded
+        parser = parser_class(reference, text=text.encode().decode())
+        apis.append(RefAPI(reference, {}, parser=parser, lean=lean))
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return size / count
+
+
+def main(count=200):
+    logging.disable(logging.WARNING)
+    texts = {
+        "crossref": read_test_file("crossref_test_example.xml"),
+        "arXiv": read_test_file("arXiv_test_example.xml"),
+    }
+    print(f"{'api':<10}{'default':>12}{'lean':>12}")
+    for name, parser_class, reference in CASES:
+        default = measure(parser_class, reference, texts[name], count, False)
+        lean = measure(parser_class, reference, texts[name], count, True)
+        print(f"{name:<10}{default / 1024:>10.1f}kB{lean / 1024:>10.1f}kB")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
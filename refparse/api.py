@@ -4,14 +4,30 @@
 """Main API class"""
 
 
-from refparse.parser import CrossRefParser, arXivParser
+from refparse.parser import CrossRefParser, CrossRefCSLParser, arXivParser
+from refparse.templates import FastTemplate, UnsupportedTemplate
+from refparse import templates
 from Cheetah.Template import Template
+from refparse.render_cache import record_hash
+from refparse.metrics import METRICS
 from refparse.utils import Filters
+from functools import lru_cache
 import logging
+import copy
+import time
 import re
 
 api_logger = logging.getLogger("API")
 api_method = {"crossref": CrossRefParser, "arXiv": arXivParser}
+# representations of a doi that can be requested, see RefAPI doi_source
+doi_method = {"unixsd": CrossRefParser, "csl": CrossRefCSLParser}
+
+DOI_PATTERN = re.compile(r"10.\d{4,9}/[-._;()/:a-zA-Z0-9]+")
+ARXIV_PATTERN1 = re.compile(r"\d{4}.\d{4,5}(v\d)?")
+ARXIV_PATTERN2 = re.compile(r"[-a-z]+(.[A-Z]{2})?/\d{7}(v\d)?")
+
+PLACEHOLDER_PATTERN = re.compile(r"\$\{?([A-Za-z_]\w*)")
+NAME_PATTERN = re.compile(r"[A-Za-z_]\w*")
 
 
 class RefAPI:
@@ -20,40 +36,167 @@ class RefAPI:
     For attribute that is None, empty string will be returned
     """
 
-    def __init__(self, reference, format_template):
+    render_cache = None
+
+    def __init__(
+        self,
+        reference,
+        format_template,
+        parser=None,
+        sources=(),
+        offline=False,
+        store=None,
+        max_age=None,
+        lean=False,
+        fields=None,
+        stream=False,
+        doi_source="unixsd",
+        render_cache=None,
+    ):
         """Initiate the object with different apis
 
         :param url string: the url of the target
+        :param parser ParserBase: parser of the reference that is already
+            requested, e.g. from a batch
+        :param sources list: local sources (e.g. OfflineIndex) that are
+            looked up before the api, in order
+        :param offline bool: only use the local sources
+        :param store RecordStore: store that is looked up first, records
+            resolved otherwise are saved to it
+        :param max_age float: stored records older than max_age seconds
+            are revalidated with a conditional request, never if None
+        :param lean bool: only keep the parsed fields of the parser, the
+            response text and the parsed tree are released
+        :param fields set: fields used by the rendered formats (see
+            template_fields), other costly fields are not parsed. The
+            stored record is saved with the fields, it is parsed again if
+            a later request uses more fields
+        :param stream bool: stream the responses and stop reading once
+            the parsed fields are read (see ParserBase.read_stream)
+        :param doi_source str: representation requested for DOIs, the
+            crossref "unixsd" XML or the smaller "csl" JSON (see doi_method)
+        :param render_cache RenderCache: persistent cache of the rendered
+            output, looked up before rendering
         """
 
+        self.render_cache = render_cache
         cleaned_ref, api_type = self.match_reference(reference)
         if api_type:
+            self.doi_source = doi_source
             self.format_template = format_template
-            self.parser = api_method[api_type](cleaned_ref)
-            self.status = self.parser.ok
+            save = store is not None
+            if store is not None and parser is None:
+                parser = self.load_stored(
+                    cleaned_ref, api_type, store, max_age, offline, fields
+                )
+                save = parser is None
+            self.parser = parser or self.resolve(
+                cleaned_ref, api_type, sources, offline, fields, stream
+            )
+            self.status = self.parser is not None and self.parser.ok
             self.output = {}
+            if lean and self.parser is not None:
+                self.parser.release()
+            if self.status and save:
+                store.save(
+                    cleaned_ref,
+                    api_type,
+                    self.parser.record,
+                    self.parser.validators,
+                    self.parser.fields,
+                )
         else:
             self.status = False
 
-    def match_reference(self, reference):
+    def load_stored(
+        self, reference, api_type, store, max_age, offline, fields=None
+    ):
+        """Create the parser from the record in the store
+
+        Records older than max_age are revalidated: if the response is
+        not modified, the stored record is used without parsing; if it
+        is modified, the new record replaces the stored one; if the
+        request fails, the stored record is used.
+        Return None if the reference is not in the store, or its record
+        was parsed without some of the fields
+        """
+        entry = store.entry(reference, api_type, fields)
+        if entry is None:
+            return None
+        parser_class = self.parser_class(api_type)
+        age = time.time() - entry["updated"]
+        if max_age is not None and age > max_age and not offline:
+            api_logger.debug(f"revalidate {reference}")
+            parser = parser_class(
+                reference,
+                validators=entry["validators"],
+                fields=entry["fields"],
+            )
+            if parser.not_modified:
+                store.touch(reference, api_type)
+            elif parser.ok:
+                store.save(
+                    reference,
+                    api_type,
+                    parser.record,
+                    parser.validators,
+                    parser.fields,
+                )
+                return parser
+            else:
+                api_logger.warning(f"use stored record of {reference}")
+                METRICS.increment("store.stale_served")
+        else:
+            api_logger.debug(f"{reference} found in store")
+        return parser_class(reference, record=entry["record"])
+
+    def resolve(
+        self, reference, api_type, sources, offline, fields=None, stream=False
+    ):
+        """Create the parser from the first source that has the record
+
+        If no source has the record the api is requested, unless offline
+        """
+        for source in sources:
+            record = source.lookup(reference, api_type)
+            if record is not None:
+                api_logger.debug(f"{reference} found in {source.path}")
+                return api_method[api_type](reference, record=record)
+        if offline:
+            api_logger.error(f"{reference} is not found offline")
+            return None
+        return self.parser_class(api_type)(
+            reference, fields=fields, stream=stream
+        )
+
+    def parser_class(self, api_type):
+        """Parser requesting the reference, DOIs use the doi_source"""
+        if api_type == "crossref":
+            return doi_method[self.doi_source]
+        return api_method[api_type]
+
+    @staticmethod
+    def match_reference(reference, quiet=False):
         """Match reference into either doi or arXiv ID
 
         The pattern for doi can be found on the API page
         arXiv ID has types, pre-2007 and post-2007
         Here the patterns are slightly modified to do a full search
+        :param quiet bool: do not log invalid references, e.g. for text
+            that is still being typed
         """
-        doi_pattern = re.compile(r"10.\d{4,9}/[-._;()/:a-zA-Z0-9]+")
-        arxiv_pattern1 = re.compile(r"\d{4}.\d{4,5}(v\d)?")
-        arxiv_pattern2 = re.compile(r"[-a-z]+(.[A-Z]{2})?/\d{7}(v\d)?")
-
-        if doi_pattern.search(reference):
-            return doi_pattern.search(reference).group(0), "crossref"
-        elif arxiv_pattern1.search(reference):
-            return arxiv_pattern1.search(reference).group(0), "arXiv"
-        elif arxiv_pattern2.search(reference):
-            return arxiv_pattern2.search(reference).group(0), "arXiv"
+
+        if DOI_PATTERN.search(reference):
+            return DOI_PATTERN.search(reference).group(0), "crossref"
+        elif ARXIV_PATTERN1.search(reference):
+            return ARXIV_PATTERN1.search(reference).group(0), "arXiv"
+        elif ARXIV_PATTERN2.search(reference):
+            return ARXIV_PATTERN2.search(reference).group(0), "arXiv"
         else:
-            api_logger.error(f"{reference} is not a valid doi or arXiv ID")
+            if not quiet:
+                api_logger.error(
+                    f"{reference} is not a valid doi or arXiv ID"
+                )
             return reference, ""
 
     def render(self, ref_format):
@@ -66,11 +209,91 @@ class RefAPI:
         if not self.status:
             return
         elif ref_format not in self.output:
+            source = self.format_template[ref_format]
+            output = self.cached(source)
+            if output is None:
+                output = render_template(
+                    compile_template(source, templates.FAST_TEMPLATES),
+                    self.parser.parsed,
+                )
+                if self.render_cache is not None:
+                    self.render_cache.put(self.record_key, source, output)
+            self.output[ref_format] = output
+        return self.output[ref_format]
 
-            template = self.format_template[ref_format]
-            result = Template(
-                template, searchList=[{"FN": Filters}, self.parser.parsed],
-            )
+    def upgrade(self, published):
+        """Merge the record of the published article into a preprint
 
-            self.output[ref_format] = str(result)
-        return self.output[ref_format]
+        The fields of the published article replace the preprint ones,
+        fields it does not have (e.g. the abstract and the arXiv ID) are
+        kept. The rendered output is dropped.
+        :param published RefAPI: resolved doi of the preprint
+        """
+        merged = self.parser.parsed
+        for key, value in published.parser.parsed.items():
+            if value not in ("", [], None):
+                merged[key] = value
+        self.parser = copy.copy(published.parser)
+        self.parser.parsed = merged
+        self.output = {}
+        self._record_key = None
+
+    @property
+    def record_key(self):
+        """Hash of the parsed fields, the key in the render cache"""
+        if getattr(self, "_record_key", None) is None:
+            self._record_key = record_hash(self.parser.parsed)
+        return self._record_key
+
+    def cached(self, source):
+        """Output of the template source in the render cache, or None"""
+        if self.render_cache is None:
+            return None
+        return self.render_cache.get(self.record_key, source)
+
+
+@lru_cache(maxsize=None)
+def compile_template(source, fast=True):
+    """Compile the template source
+
+    :param fast bool: translate simple templates into a Python function
+        (see FastTemplate), the others are compiled by Cheetah
+    :return: a FastTemplate or a Cheetah template class
+    """
+    if fast:
+        try:
+            return FastTemplate(source)
+        except UnsupportedTemplate as e:
+            api_logger.debug(f"template rendered by Cheetah: {str(e)}")
+    return Template.compile(source)
+
+
+def render_template(template, parsed):
+    """Render a compiled template with the parsed fields"""
+    if isinstance(template, FastTemplate):
+        try:
+            return template.render(parsed)
+        except Exception:
+            # e.g. names that are not fields, Cheetah renders (or raises)
+            # as usual
+            template = compile_template(template.source, fast=False)
+    return str(template(searchList=[{"FN": Filters}, parsed]))
+
+
+def template_fields(format_template, formats):
+    """Names of the fields the templates of the formats may use
+
+    The names are over-estimated: placeholders, and any name in directive
+    lines (the $ is optional in Cheetah directives). Templates that look
+    up names dynamically use all fields, None is returned.
+    """
+    fields = set()
+    for ref_format in formats:
+        source = format_template[ref_format]
+        if "getVar" in source or "searchList" in source:
+            return None
+        fields.update(PLACEHOLDER_PATTERN.findall(source))
+        for line in source.splitlines():
+            if line.lstrip().startswith("#"):
+                fields.update(NAME_PATTERN.findall(line))
+    return fields
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Resolve batches of references"""
+
+
+from refparse.api import (
+    RefAPI,
+    api_method,
+    DOI_PATTERN,
+    compile_template,
+    render_template,
+)
+from refparse.parser import CrossRefBulkFetcher, CrossRefJSONParser
+from refparse.scheduler import lookup_priority, BULK
+from refparse import templates
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+import multiprocessing
+import logging
+
+batch_logger = logging.getLogger("Batch")
+
+# compiled templates of a render worker process, (format, template) pairs
+WORKER_TEMPLATES = []
+
+
+def init_render_worker(format_template, formats, fast=True):
+    """Compile the templates once per worker process"""
+    WORKER_TEMPLATES[:] = [
+        (ref_format, compile_template(format_template[ref_format], fast))
+        for ref_format in formats
+    ]
+
+
+def render_worker(record):
+    """Render all formats of a parsed record in a worker process"""
+    parsed = defaultdict(str, record)
+    return [
+        render_template(template, parsed) for _, template in WORKER_TEMPLATES
+    ]
+
+
+def render_parallel(
+    records, format_template, formats, processes=None, chunksize=64
+):
+    """Render parsed records in a process pool
+
+    The records are sent to the workers in chunks, the results are
+    returned in the order of the records.
+    :param records list: parsed fields of the references
+    :param format_template dict: format configuration
+    :param formats list: formats to render
+    :param processes int: number of processes, default the cpu count
+    :param chunksize int: number of records per task
+    :return list: per record, the rendered formats in order of formats
+    """
+    initargs = (format_template, list(formats), templates.FAST_TEMPLATES)
+    with multiprocessing.Pool(processes, init_render_worker, initargs) as pool:
+        return list(pool.imap(render_worker, records, chunksize))
+
+
+class RefBatch:
+    """Resolve a list of references
+
+    The RefAPI objects are stored in the order of the references.
+    """
+
+    def __init__(
+        self,
+        references,
+        format_template,
+        bulk=False,
+        sources=(),
+        offline=False,
+        store=None,
+        max_age=None,
+        lean=True,
+        fields=None,
+        stream=False,
+        doi_source="unixsd",
+        render_cache=None,
+        upgrade=False,
+        journal=None,
+    ):
+        """Resolve the references
+
+        :param references list: doi or arXiv ID of the articles
+        :param format_template dict: format configuration
+        :param bulk bool: fetch the DOIs in groups from the crossref
+            REST API, DOIs that are not found are requested one by one
+        :param sources list: local sources looked up before the api
+        :param offline bool: only use the local sources
+        :param store RecordStore: store of the resolved records
+        :param max_age float: revalidate stored records older than
+            max_age seconds
+        :param lean bool: only keep the parsed fields (see RefAPI)
+        :param fields set: fields to parse (see RefAPI)
+        :param stream bool: stream the responses (see RefAPI)
+        :param doi_source str: representation requested for DOIs that are
+            not fetched in bulk (see RefAPI)
+        :param render_cache RenderCache: persistent cache of the output
+        :param upgrade bool: resolve the DOIs of published preprints and
+            merge them into the arXiv records (see upgrade_preprints)
+        :param journal JobJournal: journal of the batch, the finished
+            references are not resolved again, the others are recorded
+        """
+        self.references = list(references)
+        self.format_template = format_template
+        self.sources = list(sources)
+        self.store = store
+        self.render_cache = render_cache
+        self.fields = fields
+        self.journal = journal
+        # the references of a batch are resolved as bulk lookups
+        with lookup_priority(BULK):
+            parsers = self.bulk_parsers() if bulk and not offline else {}
+            self.apis = []
+            for index, reference in enumerate(self.references):
+                parser = parsers.get(reference)
+                finished = journal is not None and index in journal.done
+                if finished:
+                    parser = self.journaled_parser(journal.done[index])
+                api = RefAPI(
+                    reference,
+                    format_template,
+                    parser=parser,
+                    sources=sources,
+                    offline=offline,
+                    # the finished records are already saved
+                    store=None if finished else store,
+                    max_age=max_age,
+                    lean=lean,
+                    fields=fields,
+                    stream=stream,
+                    doi_source=doi_source,
+                    render_cache=render_cache,
+                )
+                if journal is not None and not finished:
+                    _, api_type = RefAPI.match_reference(reference, quiet=True)
+                    record = api.parser.record if api.status else None
+                    journal.record(index, reference, api_type, record)
+                self.apis.append(api)
+            if upgrade:
+                self.upgrade_preprints(
+                    sources=sources,
+                    offline=offline,
+                    store=store,
+                    max_age=max_age,
+                    lean=lean,
+                    fields=fields,
+                    doi_source=doi_source,
+                )
+
+    def upgrade_preprints(self, workers=8, **kwargs):
+        """Replace arXiv records that have a published doi
+
+        The DOIs of all preprints are resolved together in a thread pool,
+        each published record is merged into its preprint (RefAPI.upgrade)
+        :param workers int: number of concurrent requests
+        :param kwargs: passed to RefAPI
+        """
+        preprints = defaultdict(list)
+        for api in self.apis:
+            if api.status and api.parser.parsed["published_doi"]:
+                preprints[api.parser.parsed["published_doi"]].append(api)
+        if not preprints:
+            return
+
+        def resolve(doi):
+            with lookup_priority(BULK):
+                return RefAPI(doi, self.format_template, **kwargs)
+
+        count = 0
+        with ThreadPoolExecutor(workers) as executor:
+            published = executor.map(resolve, preprints)
+            for doi, published_api in zip(preprints, published):
+                if published_api.status:
+                    for api in preprints[doi]:
+                        api.upgrade(published_api)
+                        count += 1
+        batch_logger.info(f"{count} preprints upgraded to doi")
+
+    @staticmethod
+    def journaled_parser(entry):
+        """Create the parser from the record of a journal entry"""
+        reference, _ = RefAPI.match_reference(entry["reference"], quiet=True)
+        return api_method[entry["api_type"]](reference, record=entry["record"])
+
+    def is_local(self, doi):
+        """Check if the store (with the fields) or a source has the doi"""
+        if self.store is not None and (
+            self.store.lookup(doi, "crossref", self.fields) is not None
+        ):
+            return True
+        return any(
+            source.lookup(doi, "crossref") is not None
+            for source in self.sources
+        )
+
+    def bulk_parsers(self):
+        """Fetch the DOIs in bulk and parse the returned works
+
+        DOIs that are in the store, one of the local sources or finished
+        in the journal are skipped
+        """
+        done = self.journal.done if self.journal is not None else {}
+        dois = {}
+        for index, reference in enumerate(self.references):
+            if index in done:
+                continue
+            match = DOI_PATTERN.search(reference)
+            if match and not self.is_local(match.group(0)):
+                dois[reference] = match.group(0)
+
+        works = CrossRefBulkFetcher().fetch(dois.values())
+        parsers = {}
+        for reference, doi in dois.items():
+            if doi.lower() in works:
+                parsers[reference] = CrossRefJSONParser(
+                    doi, text=works[doi.lower()], fields=self.fields
+                )
+        return parsers
+
+    def render(self, ref_format):
+        """Render all references, None for the failed ones"""
+        return [api.render(ref_format) for api in self.apis]
+
+    def render_all(self, formats, processes=1, chunksize=64):
+        """Render the formats of all references
+
+        With more than one process, the records are rendered in a process
+        pool (see render_parallel), the output is stored in the RefAPI
+        objects.
+        :return list: per reference, the (format, result) pairs, empty
+            for the failed references
+        """
+        apis = [api for api in self.apis if api.status]
+        if processes != 1 and apis:
+            sources = [self.format_template[f] for f in formats]
+            for api in apis:
+                for ref_format, source in zip(formats, sources):
+                    output = api.cached(source)
+                    if output is not None:
+                        api.output[ref_format] = output
+            # only records with missed formats are sent to the pool
+            apis = [
+                api
+                for api in apis
+                if any(ref_format not in api.output for ref_format in formats)
+            ]
+        if processes != 1 and apis:
+            records = [dict(api.parser.parsed) for api in apis]
+            rendered = render_parallel(
+                records, self.format_template, formats, processes, chunksize
+            )
+            for api, outputs in zip(apis, rendered):
+                api.output.update(zip(formats, outputs))
+            if self.render_cache is not None:
+                self.render_cache.put_many(
+                    (api.record_key, source, output)
+                    for api, outputs in zip(apis, rendered)
+                    for source, output in zip(sources, outputs)
+                )
+
+        return [
+            [(ref_format, api.render(ref_format)) for ref_format in formats]
+            if api.status
+            else []
+            for api in self.apis
+        ]
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Circuit breakers of the upstream APIs
+
+Each upstream (host) has a breaker. After FAILURE_THRESHOLD consecutive
+failures (timeouts, connection errors, 429 and 5xx responses) the breaker
+opens and requests fail fast without reaching the upstream. After
+RESET_TIMEOUT seconds a single probe request is let through (half-open),
+the breaker closes if it succeeds and opens again otherwise.
+"""
+
+
+from refparse.scheduler import upstream_slot
+from refparse.metrics import METRICS
+from urllib.parse import urlsplit
+import requests
+import threading
+import logging
+import time
+
+breaker_logger = logging.getLogger("Breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# responses of a struggling upstream, other errors are the request's fault
+FAILURE_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitBreaker:
+    """Circuit breaker of a single upstream"""
+
+    FAILURE_THRESHOLD = 5
+    RESET_TIMEOUT = 30
+
+    def __init__(
+        self,
+        name,
+        failure_threshold=FAILURE_THRESHOLD,
+        reset_timeout=RESET_TIMEOUT,
+    ):
+        """
+        :param name str: name of the upstream, used in logs and metrics
+        :param failure_threshold int: consecutive failures to open
+        :param reset_timeout float: seconds before probing an open upstream
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened = 0
+        self.probing = False
+        self.set_state(CLOSED)
+
+    def set_state(self, state):
+        self.state = state
+        METRICS.set_gauge(f"breaker.{self.name}.state", state)
+
+    def allow(self):
+        """Check if a request may be sent to the upstream
+
+        In the half-open state only one probe is in flight at a time.
+        """
+        with self.lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened < self.reset_timeout:
+                    METRICS.increment(f"breaker.{self.name}.rejected")
+                    return False
+                breaker_logger.info(f"{self.name} half-open, probing")
+                self.set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self.probing:
+                    METRICS.increment(f"breaker.{self.name}.rejected")
+                    return False
+                self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.probing = False
+            if self.state != CLOSED:
+                breaker_logger.info(f"{self.name} closed")
+                self.set_state(CLOSED)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            METRICS.increment(f"breaker.{self.name}.failures")
+            if (
+                self.state == HALF_OPEN
+                or self.failures >= self.failure_threshold
+            ):
+                if self.state != OPEN:
+                    breaker_logger.warning(
+                        f"{self.name} open after {self.failures} failures"
+                    )
+                self.opened = time.monotonic()
+                self.set_state(OPEN)
+
+
+BREAKERS = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(url):
+    """Return the breaker of the upstream of the url"""
+    name = urlsplit(url).hostname or url
+    with _breakers_lock:
+        if name not in BREAKERS:
+            BREAKERS[name] = CircuitBreaker(name)
+        return BREAKERS[name]
+
+
+def reset_breakers():
+    """Forget the state of all upstreams"""
+    with _breakers_lock:
+        BREAKERS.clear()
+
+
+def guarded_get(url, **kwargs):
+    """GET the url through the breaker of its upstream
+
+    The breaker is checked first, then the request waits for a slot of
+    the upstream scheduler, in the priority class of the thread (see
+    refparse.scheduler), so a request to an unavailable upstream does
+    not queue for a slot only to be rejected.
+    Return the response, None if the upstream is unavailable (the
+    breaker is open) or the request failed
+    :param kwargs: passed to requests.get
+    """
+    breaker = get_breaker(url)
+    if not breaker.allow():
+        breaker_logger.error(f"{breaker.name} is unavailable, not requested")
+        return None
+    with upstream_slot(url):
+        METRICS.increment(f"requests.{breaker.name}")
+        try:
+            r = requests.get(url, **kwargs)
+        except requests.RequestException as e:
+            breaker.record_failure()
+            breaker_logger.error(f"request failed due to {str(e)}")
+            return None
+    if r.status_code in FAILURE_STATUS:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return r
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Citation graph crawler
+
+The crossref unixsd response of a doi lists the DOIs it cites. The
+crawler follows them breadth-first from the seed DOIs, each level is
+requested by a bounded pool of threads with a shared rate limit, every
+doi is requested once. Records and citation edges are emitted as they
+complete.
+"""
+
+
+from refparse.parser import CrossRefParser
+from refparse.scheduler import lookup_priority, BULK
+from refparse.utils import get_string
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import logging
+import time
+
+crawl_logger = logging.getLogger("Crawl")
+
+
+class CitationParser(CrossRefParser):
+    """Crossref parser that also parses the cited DOIs"""
+
+    # the citation list is needed, the response is read to the end
+    STOP_TAGS = ()
+
+    def parse_api(self, soup):
+        pdict = super().parse_api(soup)
+        citations = []
+        citation_list = soup.find("citation_list")
+        if citation_list:
+            for citation in citation_list.find_all("citation"):
+                doi = get_string(citation, "doi").strip()
+                if doi:
+                    citations.append(doi)
+        pdict["citations"] = citations
+        return pdict
+
+
+class RateLimiter:
+    """Space the calls of all threads by at least 1 / rate seconds"""
+
+    def __init__(self, rate):
+        """
+        :param rate float: calls per second, unlimited if None or 0
+        """
+        self.interval = 1 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_time = 0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Crawler:
+    """Breadth-first crawler of the citations of DOIs"""
+
+    def __init__(self, depth=1, workers=4, rate=5.0, max_records=None):
+        """
+        :param depth int: levels of citations followed from the seeds
+        :param workers int: maximum number of concurrent requests
+        :param rate float: maximum number of requests per second
+        :param max_records int: stop after requesting this many DOIs
+        """
+        self.depth = depth
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.max_records = max_records
+
+    def fetch(self, doi):
+        self.limiter.wait()
+        with lookup_priority(BULK):
+            return CitationParser(doi)
+
+    def crawl(self, seeds):
+        """Crawl from the seed DOIs
+
+        Yield the events as dictionaries, a record event per resolved
+        doi, with the doi, depth and parsed record, and an edge event
+        per citation, with the citing source and cited target doi.
+        """
+        seen = set()
+        level = []
+        for doi in seeds:
+            if doi.lower() not in seen:
+                seen.add(doi.lower())
+                level.append(doi)
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            for depth in range(self.depth + 1):
+                if not level:
+                    break
+                crawl_logger.info(f"depth {depth}: {len(level)} doi")
+                futures = {
+                    executor.submit(self.fetch, doi): doi for doi in level
+                }
+                level = []
+                for future in as_completed(futures):
+                    doi = futures[future]
+                    try:
+                        parser = future.result()
+                    except Exception as e:
+                        crawl_logger.error(f"{doi} failed due to {str(e)}")
+                        continue
+                    if not parser.ok:
+                        continue
+                    record = parser.record
+                    citations = record.pop("citations")
+                    yield {
+                        "type": "record",
+                        "doi": doi,
+                        "depth": depth,
+                        "record": record,
+                    }
+                    for cited in citations:
+                        yield {"type": "edge", "source": doi, "target": cited}
+                        if depth < self.depth and cited.lower() not in seen:
+                            if self.full(seen):
+                                continue
+                            seen.add(cited.lower())
+                            level.append(cited)
+
+    def full(self, seen):
+        return self.max_records is not None and len(seen) >= self.max_records
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Background daemon that keeps RefParse warm between CLI calls
+
+The daemon listens on a unix domain socket and answers newline-delimited
+JSON requests. The client side of this module only uses the standard
+library, so the command-line interface can forward a request without
+importing Cheetah, bs4 or pylatexenc. Other processes (e.g. a batch)
+can also hold the slots of the daemon's lookup schedulers, so their
+lookups are scheduled together with the daemon's.
+"""
+
+
+from refparse.scheduler import get_scheduler, PRIORITIES
+from refparse.metrics import METRICS
+from collections import OrderedDict
+import socketserver
+import threading
+import logging
+import socket
+import json
+import os
+
+daemon_logger = logging.getLogger("Daemon")
+
+SOCKET_PATH = os.path.join(os.path.expanduser("~/.refparse"), "refparse.sock")
+
+
+def send_request(request, path=SOCKET_PATH, timeout=30):
+    """Send a request to the running daemon
+
+    Return the decoded response, or None if no daemon is reachable
+    so the caller can fall back to in-process execution.
+    :param request dict: request with an "op" key
+    :param path str: path of the unix socket
+    :param timeout float: socket timeout in seconds
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as stream:
+                line = stream.readline()
+        return json.loads(line) if line else None
+    except (OSError, ValueError):
+        return None
+
+
+class RequestLogHandler(logging.Handler):
+    """Collect log messages emitted while a request is handled
+
+    The records are grouped by thread, each request is handled in its
+    own thread, the messages are sent back to the client.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.messages = {}
+
+    def start(self):
+        self.messages[threading.get_ident()] = []
+
+    def stop(self):
+        return self.messages.pop(threading.get_ident(), [])
+
+    def emit(self, record):
+        messages = self.messages.get(threading.get_ident())
+        if messages is not None:
+            messages.append(self.format(record))
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """Handle newline-delimited JSON requests of a single connection"""
+
+    def handle(self):
+        for line in self.rfile:
+            request = {}
+            try:
+                request = json.loads(line)
+                if request.get("op") == "slot":
+                    self.server.hold_slot(request, self.rfile, self.wfile)
+                    break
+                response = self.server.dispatch(request)
+            except ValueError as e:
+                response = {"status": False, "error": str(e)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+            if request.get("op") == "shutdown":
+                threading.Thread(target=self.server.shutdown).start()
+                break
+
+
+class RefDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Long-lived server that resolves references
+
+    Resolved references are kept in memory (least recently used
+    first out) in lean mode, the rendered output is stored in the RefAPI
+    objects.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, config_loader, cache_size=1024, store=None):
+        """Bind the socket and load the format configuration
+
+        :param path str: path of the unix socket
+        :param config_loader callable: returns the format configuration
+        :param cache_size int: number of references kept in memory
+        :param store RecordStore: store used by requests that ask for it
+        """
+        # warm up the heavy imports once for the life time of the daemon
+        from refparse.api import RefAPI
+
+        self.api_class = RefAPI
+        self.config_loader = config_loader
+        self.format_config = config_loader()
+        self.cache_size = cache_size
+        self.store = store
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.log_handler = RequestLogHandler()
+        self.log_handler.setFormatter(
+            logging.Formatter("[%(levelname)s] %(name)s - %(message)s")
+        )
+        logging.getLogger().addHandler(self.log_handler)
+
+        if os.path.exists(path):
+            if send_request({"op": "ping"}, path) is not None:
+                raise OSError(f"daemon already running on {path}")
+            os.remove(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        super().__init__(path, DaemonHandler)
+
+    def server_close(self):
+        super().server_close()
+        logging.getLogger().removeHandler(self.log_handler)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+    def resolve(self, reference, use_store=True):
+        """Return the cached RefAPI object or resolve the reference"""
+        reference = reference.strip()
+        with self.lock:
+            if reference in self.cache:
+                self.cache.move_to_end(reference)
+                return self.cache[reference]
+        store = self.store if use_store else None
+        api = self.api_class(
+            reference, self.format_config, store=store, lean=True
+        )
+        if api.status:
+            with self.lock:
+                self.cache[reference] = api
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return api
+
+    def parse(self, reference, formats, use_store=True):
+        api = self.resolve(reference, use_store)
+        results = []
+        if api.status:
+            for ref_format in formats:
+                results.append((ref_format, api.render(ref_format)))
+        return {"status": api.status, "results": results}
+
+    def hold_slot(self, request, rfile, wfile):
+        """Hold a scheduler slot for a lookup of another process
+
+        The slot is granted with the response and released when the
+        client closes the connection (or dies), see
+        refparse.scheduler.remote_slot
+        """
+        upstream = request.get("upstream")
+        priority = request.get("priority")
+        if not upstream or priority not in PRIORITIES:
+            raise ValueError(f"invalid slot request {request}")
+        with get_scheduler(upstream).slot(priority):
+            wfile.write(json.dumps({"status": True}).encode("utf-8") + b"\n")
+            wfile.flush()
+            # returns when the connection is closed
+            rfile.readline()
+
+    def reload(self):
+        """Reload the format configuration, rendered output is dropped"""
+        self.format_config = self.config_loader()
+        with self.lock:
+            for api in self.cache.values():
+                api.format_template = self.format_config
+                api.output = {}
+        return {"status": True}
+
+    def dispatch(self, request):
+        """Run the requested operation and return the response"""
+        op = request.get("op")
+        self.log_handler.start()
+        try:
+            if op == "parse":
+                response = self.parse(
+                    request["reference"],
+                    request.get("formats", []),
+                    request.get("store", True),
+                )
+            elif op == "reload":
+                response = self.reload()
+            elif op == "metrics":
+                response = {"status": True, "metrics": METRICS.snapshot()}
+            elif op in ("ping", "shutdown"):
+                response = {"status": True, "cached": len(self.cache)}
+            else:
+                daemon_logger.error(f"unknown operation {op}")
+                response = {"status": False}
+        except Exception as e:
+            daemon_logger.error(f"request failed due to {str(e)}")
+            response = {"status": False}
+        response["log"] = self.log_handler.stop()
+        return response
+
+
+def serve_daemon(config_loader, path=SOCKET_PATH, store=None):
+    """Run the daemon in the foreground until it is stopped"""
+    with RefDaemon(path, config_loader, store=store) as server:
+        daemon_logger.info(f"listening on {path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            daemon_logger.info("daemon stopped")
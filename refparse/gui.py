@@ -22,17 +22,30 @@ from PySide2.QtWidgets import (
     QButtonGroup,
 )
 from PySide2.QtGui import QKeySequence, QFont
-from PySide2.QtCore import Slot, Signal, QThread, Qt
+from PySide2.QtCore import Slot, Signal, QThread, QTimer, Qt
 
 from refparse.api import RefAPI
+from refparse.scheduler import lookup_priority, BULK
+import threading
 import logging
-from collections import defaultdict
+from collections import defaultdict, OrderedDict, deque
 
 root_logger = logging.getLogger()
 gui_logger = logging.getLogger("GUI")
 
+# prefetch threads are quiet, their logs are not shown in the log box
+prefetch_state = threading.local()
+
 
 class ParserGUI(QWidget):
+
+    # milliseconds without typing before the reference is prefetched
+    PREFETCH_DELAY = 400
+    # number of resolved references kept
+    CACHE_SIZE = 64
+    # milliseconds between updates of the log box
+    LOG_INTERVAL = 100
+
     def __init__(self, format_config):
         """The main GUI of the ref parser
 
@@ -47,6 +60,19 @@ class ParserGUI(QWidget):
         self.api_object = None
         self.__threads = []
 
+        # resolved references by cleaned reference, filled by the
+        # prefetch as the reference is typed and by the searches
+        self.results = OrderedDict()
+        # prefetches in flight, and the one a search waits for
+        self.pending = set()
+        self.awaited = None
+        self.generation = 0
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(self.PREFETCH_DELAY)
+        self.prefetch_timer.timeout.connect(self.prefetch)
+        self.ref_line.textChanged.connect(self.schedule_prefetch)
+
     def init_layout(self, format_config):
         """Initiate layouts
 
@@ -101,13 +127,16 @@ class ParserGUI(QWidget):
         # set the log box to half of the size
         self.log_box.setMaximumHeight(self.log_box.sizeHint().height() / 2)
 
-        # custom signal handler
-        log_handler = QLogHandler(self)
-        log_handler.setFormatter(
+        # custom handler, the buffered records are appended periodically
+        self.log_handler = QLogHandler()
+        self.log_handler.setFormatter(
             logging.Formatter("[%(levelname)s] %(name)s - %(message)s")
         )
-        root_logger.addHandler(log_handler)
-        log_handler.signal.log_str.connect(self.log_box.append)
+        root_logger.addHandler(self.log_handler)
+        self.log_timer = QTimer(self)
+        self.log_timer.setInterval(self.LOG_INTERVAL)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start()
 
         grid.addWidget(QLabel("Log:"), 5, 0, Qt.AlignTop)
         grid.addWidget(self.log_box, 5, 1)
@@ -127,9 +156,19 @@ class ParserGUI(QWidget):
         """
 
         self.reset_content()
+        self.prefetch_timer.stop()
         reference = self.ref_line.text()
-
-        if reference:
+        cleaned_ref, _ = RefAPI.match_reference(reference, quiet=True)
+
+        if cleaned_ref in self.results:
+            gui_logger.info(f"Search reference: {reference} (prefetched)")
+            self.results.move_to_end(cleaned_ref)
+            self.output(self.results[cleaned_ref])
+        elif cleaned_ref in self.pending:
+            # the result is shown when the prefetch finishes
+            gui_logger.info(f"Search reference: {reference}")
+            self.awaited = cleaned_ref
+        elif reference:
             gui_logger.info(f"Search reference: {reference}")
             ref_thread = RefThread(reference, self.format_config, parent=self)
             ref_thread.response_obj.connect(self.output)
@@ -146,8 +185,56 @@ class ParserGUI(QWidget):
         store the api object to the GUI
         """
         self.api_object = api_object
+        if api_object.status:
+            self.cache_result(api_object)
         self.change_format()
 
+    def cache_result(self, api_object):
+        cleaned_ref = api_object.parser.parsed["reference"]
+        self.results[cleaned_ref] = api_object
+        self.results.move_to_end(cleaned_ref)
+        if len(self.results) > self.CACHE_SIZE:
+            self.results.popitem(last=False)
+
+    def schedule_prefetch(self):
+        """Restart the prefetch delay as the reference is typed
+
+        Prefetches started for an earlier text are outdated, their
+        results are dropped.
+        """
+        self.generation += 1
+        self.prefetch_timer.start()
+
+    def prefetch(self):
+        """Resolve a complete reference in the background"""
+        reference = self.ref_line.text().strip()
+        cleaned_ref, api_type = RefAPI.match_reference(reference, quiet=True)
+        # the reference is complete if nothing is typed after the match
+        if not api_type or not reference.endswith(cleaned_ref):
+            return
+        if cleaned_ref in self.results or cleaned_ref in self.pending:
+            return
+        gui_logger.debug(f"prefetch {cleaned_ref}")
+        self.pending.add(cleaned_ref)
+        prefetch_thread = PrefetchThread(
+            cleaned_ref, self.format_config, self.generation, parent=self
+        )
+        prefetch_thread.response_obj.connect(self.prefetched)
+        prefetch_thread.start()
+
+    @Slot(str, int, object)
+    def prefetched(self, reference, generation, api_object):
+        """Cache the prefetched reference unless the text changed since
+
+        If a search waits for the reference, it is shown in any case.
+        """
+        self.pending.discard(reference)
+        if reference == self.awaited:
+            self.awaited = None
+            self.output(api_object)
+        elif generation == self.generation and api_object.status:
+            self.cache_result(api_object)
+
     def change_format(self):
         """Test the group of button if it is checked"""
         ref_format = self.format_btns.checkedButton().text()
@@ -168,9 +255,16 @@ class ParserGUI(QWidget):
         """
         self.output_box.setText(output_str)
 
+    def flush_log(self):
+        """Append the buffered log records to the log box at once"""
+        messages = self.log_handler.drain()
+        if messages:
+            self.log_box.append("<br>".join(messages))
+
     def reset_content(self):
         """Clear and reset the contents"""
         self.output_box.clear()
+        self.log_handler.drain()
         self.log_box.clear()
 
     def copy(self):
@@ -211,6 +305,28 @@ class RefThread(QThread):
         self.response_obj.emit(RefAPI(self.reference, self.format_config))
 
 
+class PrefetchThread(QThread):
+    """Resolve a reference in the background, without logging to the GUI
+
+    The lookups are bulk lookups, a search goes ahead of the prefetches.
+    """
+
+    response_obj = Signal(str, int, object)
+
+    def __init__(self, reference, format_config, generation, parent=None):
+        super().__init__(parent)
+        self.reference = reference
+        self.format_config = format_config
+        self.generation = generation
+
+    def run(self):
+        """Emit the reference, generation and the parsed api object"""
+        prefetch_state.quiet = True
+        with lookup_priority(BULK):
+            api_object = RefAPI(self.reference, self.format_config)
+        self.response_obj.emit(self.reference, self.generation, api_object)
+
+
 class FormatThread(QThread):
     """Convert result to templated formats"""
 
@@ -226,34 +342,33 @@ class FormatThread(QThread):
         self.response_str.emit(self.api_object.render(self.ref_format))
 
 
-class QLogSignal(QThread):
-    """Qt signal for logging
-
-    To create a thread safe logging, need to use signal-slot to pass the
-    logging and formatting message
-    """
-
-    log_str = Signal(str)
-
-    def __init__(self, parent=None):
-        super().__init__(parent)
-
-
 class QLogHandler(logging.Handler):
     """Custom handler to stream log to QTextEdit
 
-    To have a thread safe to exit, need to define parent of the signal
-    thread, here passed as the parent parameters.
+    The records are emitted from any thread, they are buffered and the
+    GUI appends the buffer to the log box periodically (see flush_log),
+    instead of updating the log box for every record.
     """
 
-    def __init__(self, parent=None):
+    # records kept if the GUI does not keep up, older ones are dropped
+    BUFFER_SIZE = 1000
+
+    def __init__(self):
         super().__init__()
-        self.signal = QLogSignal(parent)
+        self.buffer = deque(maxlen=self.BUFFER_SIZE)
 
     def emit(self, record):
-        """Emit colored log record"""
-        coloredlog = self.colorlog(record)
-        self.signal.log_str.emit(coloredlog)
+        """Buffer colored log record"""
+        if getattr(prefetch_state, "quiet", False):
+            return
+        self.buffer.append(self.colorlog(record))
+
+    def drain(self):
+        """Return and remove the buffered records"""
+        messages = []
+        while self.buffer:
+            messages.append(self.buffer.popleft())
+        return messages
 
     def colorlog(self, record):
         """Set different color to error and warning levels
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Offline metadata index built from bulk dumps
+
+The index is a SQLite table of parsed records keyed by the canonical
+doi (lower case) or arXiv ID (without version). It is filled from the
+crossref public data file and arXiv OAI-PMH dumps, and used by RefAPI
+as a source before (or instead of) the online parsers.
+"""
+
+
+from refparse.parser import CrossRefJSONParser
+import xml.etree.ElementTree as ET
+from datetime import datetime
+import logging
+import sqlite3
+import gzip
+import json
+import os
+import re
+
+index_logger = logging.getLogger("Index")
+
+INDEX_PATH = os.path.join(os.path.expanduser("~/.refparse"), "index.sqlite")
+
+OAI_NS = "{http://www.openarchives.org/OAI/2.0/}"
+ARXIV_NS = "{http://arxiv.org/OAI/arXiv/}"
+
+
+def open_dump(path):
+    """Open a dump file, gzipped if the name ends with .gz"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def dump_files(paths, suffixes):
+    """List the dump files, directories are walked in sorted order"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in sorted(os.walk(path)):
+                for name in sorted(files):
+                    if name.endswith(suffixes):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def canonical_key(reference, api_type):
+    """Key of the reference in the index
+
+    DOIs are case insensitive, arXiv versions share the same metadata
+    """
+    if api_type == "crossref":
+        return reference.lower()
+    return re.sub(r"v\d+$", "", reference)
+
+
+def iter_crossref_works(path, skip=None):
+    """Stream the works of a crossref data file
+
+    A file is either a JSON object with an "items" list (as in the
+    public data file), or JSON lines with one work per line.
+    Only one file is in memory at a time.
+    :param skip callable: called with the location and the error of the
+        invalid lines, which are skipped. The error is raised if None
+    """
+    with open_dump(path) as f:
+        if ".jsonl" in path:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    if skip is None:
+                        raise
+                    skip(f"{path}:{number}", e)
+        else:
+            yield from json.load(f).get("items", [])
+
+
+def parse_oai_arxiv(metadata):
+    """Parse the arXiv metadata format into the arXivParser fields"""
+
+    def text(tag):
+        element = metadata.find(ARXIV_NS + tag)
+        return (element.text or "").strip() if element is not None else ""
+
+    pdict = {}
+    pdict["has_publication"] = False
+    pdict["has_print"] = False
+    pdict["published_doi"] = text("doi")
+    pdict["abstract"] = text("abstract").replace("\n", " ")
+    pdict["title"] = re.sub(r"\s*\n\s*", " ", text("title"))
+    pdict["title_latex"] = pdict["title"]
+
+    pub_date = datetime.strptime(
+        text("updated") or text("created"), "%Y-%m-%d"
+    )
+    pdict["online_year"] = str(pub_date.year)
+    pdict["online_month"] = str(pub_date.month)
+    pdict["online_day"] = str(pub_date.day)
+
+    author = []
+    for name in metadata.iter(ARXIV_NS + "author"):
+        keyname = name.find(ARXIV_NS + "keyname")
+        forenames = name.find(ARXIV_NS + "forenames")
+        author.append(
+            [
+                keyname.text if keyname is not None else "",
+                forenames.text if forenames is not None else "",
+            ]
+        )
+    pdict["author"] = author
+    return pdict
+
+
+def iter_arxiv_records(path):
+    """Stream the arXiv metadata of an OAI-PMH dump (metadataPrefix=arXiv)
+
+    The metadata elements are removed from the tree when the next record
+    is read, the memory use is bounded by a single record. Deleted
+    records, without metadata, are not yielded.
+    """
+    container = None
+    with open_dump(path) as f:
+        for event, element in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if element.tag == OAI_NS + "ListRecords":
+                    container = element
+                continue
+            if element.tag != OAI_NS + "record":
+                continue
+            metadata = element.find(f"{OAI_NS}metadata/{ARXIV_NS}arXiv")
+            if metadata is not None:
+                yield metadata
+            if container is not None:
+                container.clear()
+            else:
+                element.clear()
+
+
+class OfflineIndex:
+    """SQLite index of parsed records"""
+
+    BATCH_SIZE = 5000
+
+    def __init__(self, path=INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        # number of malformed records skipped by the ingests
+        self.skipped = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "key TEXT PRIMARY KEY, api_type TEXT, record TEXT"
+            ") WITHOUT ROWID"
+        )
+
+    def close(self):
+        self.conn.close()
+
+    def insert(self, rows):
+        """Insert (key, api_type, record) rows in bulk
+
+        Return the number of inserted rows
+        """
+        count = 0
+        batch = []
+        for key, api_type, record in rows:
+            batch.append((key, api_type, json.dumps(record)))
+            if len(batch) >= self.BATCH_SIZE:
+                count += self.insert_batch(batch)
+                batch = []
+        if batch:
+            count += self.insert_batch(batch)
+        return count
+
+    def insert_batch(self, batch):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?)", batch
+            )
+        index_logger.debug(f"{len(batch)} records inserted")
+        return len(batch)
+
+    def skip(self, reference, error):
+        """Count and log a malformed record, the ingest goes on"""
+        self.skipped += 1
+        index_logger.warning(f"{reference} skipped due to {str(error)}")
+
+    def ingest_crossref(self, paths):
+        """Ingest crossref data files or directories of them
+
+        Malformed works are skipped (see skip)
+        """
+
+        def rows():
+            for path in dump_files(paths, (".json", ".json.gz", ".jsonl.gz")):
+                index_logger.info(f"ingest {path}")
+                for work in iter_crossref_works(path, self.skip):
+                    doi = work.get("DOI")
+                    if not doi:
+                        continue
+                    try:
+                        record = CrossRefJSONParser(doi, text=work).record
+                    except Exception as e:
+                        self.skip(doi, e)
+                        continue
+                    yield canonical_key(doi, "crossref"), "crossref", record
+
+        # the parser logs per record are not useful during ingest
+        parser_log = logging.getLogger(CrossRefJSONParser.__name__)
+        level = parser_log.level
+        parser_log.setLevel(logging.WARNING)
+        try:
+            return self.insert(rows())
+        finally:
+            parser_log.setLevel(level)
+
+    def ingest_arxiv(self, paths):
+        """Ingest arXiv OAI-PMH dumps or directories of them
+
+        Malformed records are skipped (see skip)
+        """
+
+        def rows():
+            for path in dump_files(paths, (".xml", ".xml.gz")):
+                index_logger.info(f"ingest {path}")
+                for metadata in iter_arxiv_records(path):
+                    arxiv_id = metadata.findtext(ARXIV_NS + "id", "").strip()
+                    try:
+                        record = parse_oai_arxiv(metadata)
+                    except Exception as e:
+                        self.skip(arxiv_id or path, e)
+                        continue
+                    if not arxiv_id:
+                        self.skip(path, "record without id")
+                        continue
+                    yield canonical_key(arxiv_id, "arXiv"), "arXiv", record
+
+        return self.insert(rows())
+
+    def lookup(self, reference, api_type):
+        """Return the parsed record of the reference, None if not found"""
+        row = self.conn.execute(
+            "SELECT record FROM records WHERE key = ? AND api_type = ?",
+            (canonical_key(reference, api_type), api_type),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
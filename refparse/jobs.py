@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Journal of batch jobs
+
+A batch with a journal appends a JSON line per resolved reference, with
+its position in the batch, its outcome and the parsed record. The lines
+are flushed and synced every few references, so an interrupted batch
+loses at most the last unsynced lines. A resumed batch reuses the
+records of the finished references, only the failed and remaining ones
+are resolved again, and the output is rendered in the original order.
+"""
+
+
+import hashlib
+import logging
+import json
+import os
+
+job_logger = logging.getLogger("Job")
+
+
+def job_checksum(references):
+    """Hash of the references, a journal only resumes the same batch"""
+    data = "\n".join(references)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class JobJournal:
+    """Append-only journal of the references resolved by a batch"""
+
+    def __init__(self, path, references, resume=False, sync_every=100):
+        """Open the journal
+
+        :param path str: journal file, a JSON line per entry
+        :param references list: references of the batch
+        :param resume bool: keep the entries of an existing journal,
+            otherwise the journal is started over
+        :param sync_every int: number of entries between flush and fsync
+        """
+        self.path = path
+        self.sync_every = sync_every
+        self.count = 0
+        self.checksum = job_checksum(references)
+        self.done = {}
+        header = {"references": len(references), "checksum": self.checksum}
+        if resume and os.path.isfile(path):
+            self.load()
+            self.file = open(path, "a", encoding="utf-8")
+        else:
+            self.file = open(path, "w", encoding="utf-8")
+            self.file.write(json.dumps(header) + "\n")
+            self.sync()
+
+    def load(self):
+        """Read the finished references of the journal
+
+        A line that was cut by an interruption is removed.
+        Raise ValueError if the journal is of another batch.
+        """
+        with open(self.path, "rb") as f:
+            data = f.read()
+        entries, end = [], 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+            end += len(line)
+        if not entries or entries[0].get("checksum") != self.checksum:
+            raise ValueError(f"{self.path} is not a journal of this batch")
+        if end < len(data):
+            job_logger.warning(f"incomplete entry removed from {self.path}")
+            os.truncate(self.path, end)
+        for entry in entries[1:]:
+            if entry["ok"]:
+                self.done[entry["index"]] = entry
+            else:
+                self.done.pop(entry["index"], None)
+        job_logger.info(f"{len(self.done)} finished references in journal")
+
+    def record(self, index, reference, api_type, record):
+        """Append the outcome of a reference
+
+        :param index int: position of the reference in the batch
+        :param record dict: parsed record, None if the reference failed
+        """
+        entry = {
+            "index": index,
+            "reference": reference,
+            "api_type": api_type,
+            "ok": record is not None,
+        }
+        if record is not None:
+            entry["record"] = record
+        self.file.write(json.dumps(entry) + "\n")
+        self.count += 1
+        if self.count % self.sync_every == 0:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        """Sync the remaining entries and close the journal"""
+        self.sync()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Journal title abbreviations
+
+The bundled journals.tsv lists normalized journal titles with their ISO4
+abbreviation, one "title<TAB>abbreviation" line per journal, sorted by
+the title bytes. The file is memory-mapped on the first lookup and
+searched by bisection over the lines, nothing is loaded into memory.
+Larger lists (e.g. from the LTWA) can be bundled with build_index.
+"""
+
+
+import unicodedata
+import html
+import threading
+import logging
+import mmap
+import os
+import re
+
+journal_logger = logging.getLogger("Journals")
+
+JOURNALS_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "journals.tsv"
+)
+
+
+def normalize(title):
+    """Normalize a journal title for the lookup
+
+    Accents, case, punctuation, "&" (or "&amp;") and a leading "the" are
+    ignored, e.g. "The Journal of Physical Chemistry C" and "journal of
+    physical chemistry, c" are the same journal.
+    """
+    title = unicodedata.normalize("NFKD", html.unescape(title))
+    title = title.encode("ascii", "ignore").decode("ascii").lower()
+    title = title.replace("&", " and ")
+    title = re.sub(r"[^a-z0-9]+", " ", title).strip()
+    return re.sub(r"^the ", "", title)
+
+
+def build_index(entries, path=JOURNALS_PATH):
+    """Write the (title, abbreviation) entries as a sorted index file"""
+    lines = {normalize(title): abbrev.strip() for title, abbrev in entries}
+    with open(path, "wb") as f:
+        for title in sorted(lines, key=lambda t: t.encode("utf-8")):
+            f.write(f"{title}\t{lines[title]}\n".encode("utf-8"))
+    return len(lines)
+
+
+class JournalIndex:
+    """Memory-mapped sorted index of journal abbreviations"""
+
+    def __init__(self, path=JOURNALS_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self.map.close()
+
+    def line(self, start):
+        """Return the title and abbreviation of the line at start"""
+        end = self.map.find(b"\n", start)
+        end = len(self.map) if end < 0 else end
+        title, _, abbrev = self.map[start:end].partition(b"\t")
+        return title, abbrev, end + 1
+
+    def lower_bound(self, key):
+        """Start of the first line with a title not less than key"""
+        low, high = 0, len(self.map)
+        while low < high:
+            start = self.map.rfind(b"\n", 0, (low + high) // 2) + 1
+            title, _, next_start = self.line(start)
+            if title < key:
+                low = next_start
+            else:
+                high = start
+        return low
+
+    def lookup(self, title):
+        """Return the abbreviation of the journal title, None if unknown"""
+        key = normalize(title).encode("utf-8")
+        start = self.lower_bound(key)
+        if start < len(self.map):
+            found, abbrev, _ = self.line(start)
+            if found == key:
+                return abbrev.decode("utf-8")
+        return None
+
+    def prefix(self, prefix, limit=10):
+        """List (title, abbreviation) of the journals starting with prefix"""
+        key = normalize(prefix).encode("utf-8")
+        start = self.lower_bound(key)
+        matches = []
+        while start < len(self.map) and len(matches) < limit:
+            title, abbrev, start = self.line(start)
+            if not title.startswith(key):
+                break
+            matches.append((title.decode("utf-8"), abbrev.decode("utf-8")))
+        return matches
+
+    def __len__(self):
+        count, start = 0, self.map.find(b"\n")
+        while start >= 0:
+            count, start = count + 1, self.map.find(b"\n", start + 1)
+        return count
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def journal_index():
+    """The bundled index, opened on the first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = JournalIndex()
+    return _index
+
+
+def abbreviate(title):
+    """ISO4 abbreviation of the journal title, empty string if unknown"""
+    if not title:
+        return ""
+    return journal_index().lookup(title) or ""
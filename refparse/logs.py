@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Logging off the hot path
+
+The handlers of the root logger (e.g. the console handler of the
+command-line interface) are moved behind a queue: loggers only put the
+records on the queue, a listener thread formats and writes them.
+During batches, repeated messages are aggregated into a summary
+instead of being written one by one.
+"""
+
+
+from logging.handlers import QueueHandler, QueueListener
+from collections import Counter
+import threading
+import logging
+import atexit
+import queue
+
+root_logger = logging.getLogger()
+log_logger = logging.getLogger("Log")
+
+_listener = None
+
+
+def start_queue_logging():
+    """Move the handlers of the root logger behind a queue
+
+    The listener thread is stopped, and the queue drained, at exit.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    handlers = list(root_logger.handlers)
+    log_queue = queue.Queue()
+    for handler in handlers:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(QueueHandler(log_queue))
+    _listener = QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(stop_queue_logging)
+    return _listener
+
+
+def stop_queue_logging():
+    """Write the queued records and restore the handlers"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in list(root_logger.handlers):
+            if isinstance(handler, QueueHandler):
+                root_logger.removeHandler(handler)
+        for handler in _listener.handlers:
+            root_logger.addHandler(handler)
+        _listener = None
+
+
+def flush_logs():
+    """Wait until the queued records are written
+
+    Used before writing to the same stream, e.g. the rendered output,
+    to keep the order of the messages.
+    """
+    if _listener is not None:
+        _listener.queue.join()
+
+
+class SummaryFilter(logging.Filter):
+    """Aggregate repeated messages
+
+    Messages below WARNING are counted, warnings and errors are passed
+    until the same message was seen `limit` times, then counted.
+    """
+
+    def __init__(self, limit=5):
+        super().__init__()
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.seen = Counter()
+        self.counts = Counter()
+
+    def filter(self, record):
+        # the summary itself is always written
+        if record.name == log_logger.name:
+            return True
+        key = (record.name, record.levelname, record.getMessage())
+        with self.lock:
+            self.seen[key] += 1
+            if record.levelno >= logging.WARNING and (
+                self.seen[key] <= self.limit
+            ):
+                return True
+            self.counts[key] += 1
+        return False
+
+    def summary(self, lines=10):
+        """Lines of the aggregated messages, the most frequent first"""
+        with self.lock:
+            common = self.counts.most_common()
+        summary = [
+            f"{count}x [{level}] {name} - {message}"
+            for (name, level, message), count in common[:lines]
+        ]
+        others = sum(count for _, count in common[lines:])
+        if others:
+            summary.append(f"{others} other messages")
+        return summary
+
+
+class summarized_logs:
+    """Context manager that summarizes the messages of a batch
+
+    The filter is added to the handlers of the root logger, the summary
+    is logged at the end.
+    """
+
+    def __init__(self, limit=5, lines=10):
+        self.filter = SummaryFilter(limit)
+        self.lines = lines
+
+    def __enter__(self):
+        for handler in root_logger.handlers:
+            handler.addFilter(self.filter)
+        return self.filter
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for handler in root_logger.handlers:
+            handler.removeFilter(self.filter)
+        summary = self.filter.summary(self.lines)
+        if summary:
+            log_logger.info("summary of the batch messages:")
+            for line in summary:
+                log_logger.info(line)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Process wide metrics
+
+Counters (e.g. requests per upstream) and gauges (e.g. the state of the
+circuit breakers) are kept in the METRICS registry, shown by
+`refparse parse --metrics` and the metrics operation of the daemon.
+"""
+
+
+from collections import Counter
+import threading
+
+
+class Metrics:
+    """Thread-safe registry of counters and gauges"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.gauges = {}
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        """Return a copy of the counters and gauges"""
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+
+
+def format_metrics(snapshot):
+    """Format a snapshot as sorted "name value" lines"""
+    values = {**snapshot["counters"], **snapshot["gauges"]}
+    return "\n".join(f"{name} {values[name]}" for name in sorted(values))
+
+
+METRICS = Metrics()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Portable packs of resolved records
+
+A pack is a compressed zip archive with a manifest and one member per
+record, named by the canonical key of the reference. Packs are exported
+from the record store and either imported into another store, or
+mounted read-only as a source of RefAPI: the central directory of the
+archive is the index, a lookup only reads and decompresses one member.
+"""
+
+
+from refparse.index import canonical_key
+from refparse.api import RefAPI
+from urllib.parse import quote
+from datetime import datetime, timezone
+import threading
+import zipfile
+import logging
+import json
+
+pack_logger = logging.getLogger("Pack")
+
+PACK_FORMAT = "refparse-pack"
+PACK_VERSION = 1
+
+
+def member_name(reference, api_type):
+    """Name of the member of a record, keys are quoted to a flat name"""
+    key = quote(canonical_key(reference, api_type), safe="")
+    return f"records/{api_type}/{key}.json"
+
+
+def export_pack(store, path, references=None):
+    """Write the records of the store into a pack
+
+    :param store RecordStore: store to export
+    :param path str: path of the pack
+    :param references list: only export these references, all if None
+    :return int: number of exported records
+    """
+    if references is None:
+        records = store.records()
+    else:
+        records = []
+        for reference in references:
+            cleaned_ref, api_type = RefAPI.match_reference(reference)
+            record = store.lookup(cleaned_ref, api_type) if api_type else None
+            if record is None:
+                pack_logger.warning(f"{reference} is not in the store")
+            else:
+                records.append((cleaned_ref, api_type, record))
+
+    names = set()
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for reference, api_type, record in records:
+            name = member_name(reference, api_type)
+            if name in names:
+                continue
+            names.add(name)
+            archive.writestr(
+                name, json.dumps({"reference": reference, "record": record})
+            )
+        created = datetime.now(timezone.utc)
+        manifest = {
+            "format": PACK_FORMAT,
+            "version": PACK_VERSION,
+            "created": created.isoformat(timespec="seconds"),
+            "count": len(names),
+        }
+        archive.writestr("manifest.json", json.dumps(manifest))
+    pack_logger.info(f"{len(names)} records exported to {path}")
+    return len(names)
+
+
+class CachePack:
+    """Read-only pack used as a source of RefAPI"""
+
+    def __init__(self, path):
+        """Open the pack and check its manifest
+
+        :raises ValueError: if the file is not a pack of a known version
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            self.archive = zipfile.ZipFile(path, "r")
+            self.manifest = json.loads(self.archive.read("manifest.json"))
+        except (zipfile.BadZipFile, KeyError, ValueError):
+            raise ValueError(f"{path} is not a refparse pack")
+        if self.manifest.get("format") != PACK_FORMAT:
+            raise ValueError(f"{path} is not a refparse pack")
+        if self.manifest.get("version") != PACK_VERSION:
+            raise ValueError(
+                f"{path} has pack version {self.manifest.get('version')}, "
+                f"version {PACK_VERSION} is supported"
+            )
+
+    def close(self):
+        self.archive.close()
+
+    def lookup(self, reference, api_type):
+        """Return the parsed record of the reference, None if not found"""
+        with self.lock:
+            try:
+                data = self.archive.read(member_name(reference, api_type))
+            except KeyError:
+                return None
+        return json.loads(data)["record"]
+
+    def records(self):
+        """Iterate (reference, api_type, record) of all records"""
+        for info in self.archive.infolist():
+            if info.filename.startswith("records/"):
+                api_type = info.filename.split("/")[1]
+                with self.lock:
+                    entry = json.loads(self.archive.read(info))
+                yield entry["reference"], api_type, entry["record"]
+
+    def import_into(self, store):
+        """Save all records into the store, return the number of records"""
+        count = 0
+        for reference, api_type, record in self.records():
+            store.save(reference, api_type, record)
+            count += 1
+        pack_logger.info(f"{count} records imported from {self.path}")
+        return count
+
+    def __len__(self):
+        return self.manifest["count"]
@@ -5,9 +5,15 @@
 
 
 from refparse.utils import get_attr, get_string, html_convert
+from refparse.breaker import guarded_get
+from refparse.journals import abbreviate
 from bs4 import BeautifulSoup
+from lxml import etree
 
-import requests
+# requests are sent by refparse.breaker.guarded_get, the module stays
+# reachable here as refparse.parser.requests is where requests are patched
+import requests  # noqa: F401
+import json
 import logging
 from collections import defaultdict
 import abc
@@ -25,38 +31,149 @@ class ParserBase(abc.ABC):
     REF_URL: str
     QUERY_URL: str
     HEADER: dict
-
-    def __init__(self, reference):
+    # seconds to wait for the upstream
+    TIMEOUT = 30
+    # elements after which a streamed response is not read, see read_stream
+    STOP_TAGS = ()
+    CHUNK_SIZE = 1 << 14
+
+    def __init__(
+        self,
+        reference,
+        text=None,
+        record=None,
+        validators=None,
+        fields=None,
+        stream=False,
+    ):
+        """Request and parse the reference
+
+        :param reference str: cleaned doi or arXiv ID
+        :param text: response that is already fetched, the reference
+            is then not requested
+        :param record dict: fields parsed before (see the record
+            property), the reference is neither requested nor parsed
+        :param validators dict: etag and last_modified of a previous
+            response, the request is conditional and the response is
+            not parsed if it is not modified
+        :param fields set: names of the fields to parse, the parsers skip
+            costly fields that are not in the set, all fields if None
+        :param stream bool: stream the response bytes into the parser and
+            stop reading at the STOP_TAGS, for parsers with STOP_TAGS
+        """
 
         self.log = logging.getLogger(self.__class__.__name__)
+        self.fields = fields
+        self.stream = stream and bool(self.STOP_TAGS)
         self.query_url = self.QUERY_URL.format(reference)
-        self.ok, self.text = self.request_text(self.query_url)
+        self.validators = {}
+        self.not_modified = False
+        if record is not None:
+            self.ok, self.text = True, None
+        elif text is None:
+            self.ok, self.text = self.request_text(self.query_url, validators)
+        else:
+            self.ok, self.text = True, text
         self.parsed = defaultdict(str)
 
-        if self.ok:
-            # needs to use xml, abstract does not show up with lxml
-            self.soup = BeautifulSoup(self.text, "xml")
+        if self.ok and not self.not_modified:
             self.parsed[self.REFNAME] = reference
             self.parsed["reference"] = reference
             self.parsed["ref_type"] = self.REFNAME.replace(" ", "_")
             self.parsed["url"] = self.REF_URL.format(reference)
-            # parse api
-            self.parsed.update(self.parse_api(self.soup))
+            if record is None:
+                # parse api
+                self.soup = self.load(self.text)
+                record = self.parse_api(self.soup)
+            self.parsed.update(record)
 
-    def request_text(self, url):
+    def wants(self, *names):
+        """Check if any of the fields is to be parsed"""
+        return self.fields is None or not self.fields.isdisjoint(names)
 
-        r = requests.get(
-            url, headers={"Accept": "application/vnd.crossref.unixsd+xml"}
+    def release(self):
+        """Drop the response text and the parsed tree
+
+        Only the parsed fields are kept, used in lean mode where many
+        parsers are kept alive to render.
+        """
+        self.text = None
+        self.soup = None
+
+    @property
+    def record(self):
+        """The parsed fields that do not depend on the reference string"""
+        reference_fields = (self.REFNAME, "reference", "ref_type", "url")
+        return {
+            key: value
+            for key, value in self.parsed.items()
+            if key not in reference_fields
+        }
+
+    def request_text(self, url, validators=None):
+
+        headers = dict(self.HEADER)
+        validators = validators or {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+        r = guarded_get(
+            url, headers=headers, timeout=self.TIMEOUT, stream=self.stream
         )
+        if r is None:
+            return False, ""
+        if r.status_code == 304:
+            self.log.info(f"{self.REFNAME} not modified")
+            self.not_modified = True
+            self.validators = validators
+            return True, ""
+        self.validators = {
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+        }
         if r.ok:
             self.log.info(f"{self.REFNAME} found")
         elif r.status_code == 404 or r.status_code == 400:
             self.log.error(f"Incorrect {self.REFNAME}")
         elif r.status_code == 504:
             self.log.error(f"Gateway timeout, please try again")
+        if self.stream and r.ok:
+            return self.read_stream(r)
         r.encoding = "utf-8"
         return r.ok, r.text
 
+    def read_stream(self, r):
+        """Feed the response bytes into an incremental XML parser
+
+        Reading stops at the first of the STOP_TAGS, the root element of
+        the part that is read is returned (see load), the remaining
+        response is never downloaded.
+        """
+        parser = etree.XMLPullParser(
+            events=("start",), tag=[f"{{*}}{tag}" for tag in self.STOP_TAGS]
+        )
+        try:
+            for chunk in r.iter_content(self.CHUNK_SIZE):
+                parser.feed(chunk)
+                for _, element in parser.read_events():
+                    root = element.getroottree().getroot()
+                    element.getparent().remove(element)
+                    self.log.debug(f"stop reading at {element.tag}")
+                    return True, root
+            return True, parser.close()
+        except etree.XMLSyntaxError as e:
+            self.log.error(f"Invalid response: {str(e)}")
+            return False, ""
+        finally:
+            r.close()
+
+    def load(self, text):
+        """Load the response text into the object passed to parse_api"""
+        # needs to use xml, abstract does not show up with lxml
+        return BeautifulSoup(text, "xml")
+
     @abc.abstractmethod
     def parse_api(self, soup):
         """The main function to parse api
@@ -72,8 +189,18 @@ class CrossRefParser(ParserBase):
     REF_URL = "http://doi.org/{}"
     QUERY_URL = "http://dx.doi.org/{}"
     HEADER = {"Accept": "application/vnd.crossref.unixsd+xml"}
+    # the citations and components follow the fields that are parsed
+    STOP_TAGS = ("citation_list", "component_list")
+
+    def load(self, text):
+        """The tree of a streamed response is parsed from the lxml tree"""
+        if isinstance(text, etree._Element):
+            return text
+        return super().load(text)
 
     def parse_api(self, soup):
+        if isinstance(soup, etree._Element):
+            return self.parse_tree(soup)
         pdict = {}
 
         pdict["has_publication"] = True
@@ -81,23 +208,28 @@ class CrossRefParser(ParserBase):
         pdict["journal_full_title"] = get_string(journal_meta, "full_title")
         pdict["journal_abbrev_title"] = get_string(
             journal_meta, "abbrev_title"
-        )
+        ) or abbreviate(pdict["journal_full_title"])
 
         article_meta = soup.journal_article
 
         author = []
         author_tag = get_attr(article_meta, "contributors")
         for name in author_tag.find_all("person_name"):
-            author.append([name.surname.string, name.given_name.string])
+            # plain strings, a NavigableString keeps the whole tree alive
+            author.append(
+                [get_string(name, "surname"), get_string(name, "given_name")]
+            )
         pdict["author"] = author
 
-        (
-            pdict["title"],
-            pdict["title_latex"],
-            pdict["title_html"],
-        ) = html_convert(get_attr(article_meta, "titles/title"))
+        if self.wants("title", "title_latex", "title_html"):
+            (
+                pdict["title"],
+                pdict["title_latex"],
+                pdict["title_html"],
+            ) = html_convert(get_attr(article_meta, "titles/title"))
 
-        pdict["abstract"] = get_string(article_meta, "abstract")
+        if self.wants("abstract"):
+            pdict["abstract"] = get_string(article_meta, "abstract")
 
         pub_online = article_meta.find(
             "publication_date", {"media_type": "online"}
@@ -129,6 +261,101 @@ class CrossRefParser(ParserBase):
             pdict["has_print"] = False
         return pdict
 
+    def parse_tree(self, root):
+        """Parse the lxml tree of a streamed response
+
+        The fields are the same as parse_api, the tree is not converted
+        to a soup.
+        """
+        pdict = {}
+
+        pdict["has_publication"] = True
+        journal_meta = tree_find(root, "journal_metadata")
+        pdict["journal_full_title"] = tree_string(journal_meta, "full_title")
+        pdict["journal_abbrev_title"] = tree_string(
+            journal_meta, "abbrev_title"
+        ) or abbreviate(pdict["journal_full_title"])
+
+        article_meta = tree_find(root, "journal_article")
+
+        author = []
+        author_tag = tree_find(article_meta, "contributors")
+        if author_tag is not None:
+            for name in author_tag.iterdescendants("{*}person_name"):
+                author.append(
+                    [
+                        tree_string(name, "surname"),
+                        tree_string(name, "given_name"),
+                    ]
+                )
+        pdict["author"] = author
+
+        if self.wants("title", "title_latex", "title_html"):
+            (
+                pdict["title"],
+                pdict["title_latex"],
+                pdict["title_html"],
+            ) = html_convert(tree_find(article_meta, "titles/title"))
+
+        if self.wants("abstract"):
+            pdict["abstract"] = tree_string(article_meta, "abstract")
+
+        pub_online = tree_date(article_meta, "online")
+        pdict["online_year"] = tree_string(pub_online, "year")
+        pdict["online_month"] = tree_string(pub_online, "month")
+        pdict["online_day"] = tree_string(pub_online, "day")
+
+        if tree_date(article_meta, "print") is not None:
+            self.log.info("print version found")
+            pdict["has_print"] = True
+            # as parse_api, the print date is read from the online date
+            pdict["print_year"] = tree_string(pub_online, "year")
+            pdict["print_month"] = tree_string(pub_online, "month")
+            pdict["print_day"] = tree_string(pub_online, "day")
+
+            first_page = tree_string(root, "pages/first_page")
+            last_page = tree_string(root, "pages/last_page")
+            pdict["pages"] = (
+                [first_page, last_page] if last_page else [first_page]
+            )
+
+            issue_meta = tree_find(root, "journal_issue")
+            pdict["volume"] = tree_string(issue_meta, "journal_volume/volume")
+            pdict["issue"] = tree_string(issue_meta, "issue")
+        else:
+            pdict["has_print"] = False
+        return pdict
+
+
+def tree_find(element, path):
+    """First descendant of the '/' separated names (as get_attr)
+
+    The names match in any namespace. Return None if not found
+    """
+    for name in path.split("/"):
+        if element is None:
+            return None
+        element = next(element.iterdescendants(f"{{*}}{name}"), None)
+    return element
+
+
+def tree_string(element, path):
+    """Stripped text of the descendant (as get_string), "" if not found"""
+    element = tree_find(element, path) if element is not None else None
+    if element is None:
+        return ""
+    return "".join(text.strip() for text in element.itertext())
+
+
+def tree_date(element, media_type):
+    """The publication_date element of the media type, None if not found"""
+    if element is None:
+        return None
+    for date in element.iterdescendants("{*}publication_date"):
+        if date.get("media_type") == media_type:
+            return date
+    return None
+
 
 class arXivParser(ParserBase):
     REF_URL = "http://arxiv.org/{}"
@@ -137,24 +364,29 @@ class arXivParser(ParserBase):
     HEADER = {}
 
     def search_doi(self, soup):
-        """Check if the article has doi"""
+        """Check if the article has doi
+
+        Return the doi of the published article, empty string if none
+        """
         doi_tag = soup.find("link", {"title": "doi"})
         if doi_tag:
             self.log.warning(f"article has doi: {doi_tag['href']}")
+            return re.sub(r"^https?://(dx\.)?doi\.org/", "", doi_tag["href"])
+        return ""
 
     def parse_api(self, soup):
         """Parse the article information"""
         pdict = {}
         pdict["has_publication"] = False
         pdict["has_print"] = False
-        self.search_doi(soup)
+        pdict["published_doi"] = self.search_doi(soup)
 
         article_meta = soup.entry
-        # remove unnecessary line break
-        pdict["abstract"] = get_string(article_meta, "summary").replace(
-            "\n", " "
-        )
-        print(repr(article_meta.summary.get_text(strip=True)))
+        if self.wants("abstract"):
+            # remove unnecessary line break
+            pdict["abstract"] = get_string(article_meta, "summary").replace(
+                "\n", " "
+            )
         # sometimes the arXiv article title has unnecessary linebreak
         pdict["title"] = get_string(article_meta, "title").replace("\n ", "")
         pdict["title_latex"] = pdict["title"]
@@ -172,3 +404,175 @@ class arXivParser(ParserBase):
             author.append([name_.group(2), name_.group(1)])
         pdict["author"] = author
         return pdict
+
+
+def first_item(work, key):
+    """Return the first string of a crossref list field"""
+    values = work.get(key) or [""]
+    return values[0] if isinstance(values, list) else values
+
+
+class CrossRefJSONParser(ParserBase):
+    """Parser for the work messages of the crossref REST API
+
+    The parsed fields are the same as the CrossRefParser. The text
+    can be the JSON string of a single work, or the work that is already
+    decoded, as returned by the CrossRefBulkFetcher.
+    """
+
+    REFNAME = "doi"
+    REF_URL = "http://doi.org/{}"
+    QUERY_URL = "https://api.crossref.org/works/{}"
+    HEADER = {}
+
+    def load(self, text):
+        if isinstance(text, dict):
+            return text
+        return json.loads(text)["message"]
+
+    @staticmethod
+    def date_parts(work, key):
+        """Return year, month and day strings of a crossref date
+
+        Empty strings if the work does not have the date, e.g. the online
+        date of a print-only work
+        """
+        date_parts = (work.get(key) or {}).get("date-parts") or [[]]
+        parts = [part for part in date_parts[0] or [] if part is not None]
+        if not parts:
+            return ["", "", ""]
+        parts = [str(parts[0])] + ["{:02d}".format(p) for p in parts[1:]]
+        return parts + [""] * (3 - len(parts))
+
+    def parse_api(self, work):
+        pdict = {}
+
+        pdict["has_publication"] = True
+        pdict["journal_full_title"] = first_item(work, "container-title")
+        pdict["journal_abbrev_title"] = first_item(
+            work, "short-container-title"
+        ) or abbreviate(pdict["journal_full_title"])
+
+        pdict["author"] = [
+            [name.get("family", ""), name.get("given", "")]
+            for name in work.get("author", [])
+        ]
+
+        if self.wants("title", "title_latex", "title_html"):
+            title = first_item(work, "title")
+            if "<" in title:
+                title_tag = BeautifulSoup(
+                    f"<title>{title}</title>", "xml"
+                ).title
+                (
+                    pdict["title"],
+                    pdict["title_latex"],
+                    pdict["title_html"],
+                ) = html_convert(title_tag)
+            else:
+                title = re.sub(r"\s+", " ", title).strip()
+                pdict["title"] = title
+                pdict["title_latex"] = pdict["title_html"] = title
+
+        if self.wants("abstract"):
+            # abstracts are in JATS, only the text is kept
+            abstract = re.sub(r"<[^>]+>", " ", work.get("abstract", ""))
+            pdict["abstract"] = re.sub(r"\s+", " ", abstract).strip()
+
+        (
+            pdict["online_year"],
+            pdict["online_month"],
+            pdict["online_day"],
+        ) = self.date_parts(work, "published-online")
+
+        if "published-print" in work:
+            self.log.info("print version found")
+            pdict["has_print"] = True
+            (
+                pdict["print_year"],
+                pdict["print_month"],
+                pdict["print_day"],
+            ) = self.date_parts(work, "published-print")
+            pdict["pages"] = work.get("page", "").split("-")
+            pdict["volume"] = work.get("volume", "")
+            pdict["issue"] = work.get("issue", "")
+        else:
+            pdict["has_print"] = False
+        return pdict
+
+
+class CrossRefCSLParser(CrossRefJSONParser):
+    """Parser for the CSL-JSON representation of a doi
+
+    doi.org returns CSL-JSON for crossref and DataCite DOIs with content
+    negotiation, the response is a fraction of the unixsd XML. The item
+    is mapped onto the crossref work, the parsed fields are the same.
+    """
+
+    QUERY_URL = "https://doi.org/{}"
+    HEADER = {"Accept": "application/vnd.citationstyles.csl+json"}
+
+    def load(self, text):
+        item = text if isinstance(text, dict) else json.loads(text)
+        work = dict(item)
+        work.setdefault(
+            "short-container-title", item.get("container-title-short", "")
+        )
+        # DataCite items only have the issued date
+        if "published-online" not in item and "published-print" not in item:
+            work["published-online"] = item.get("issued")
+        return work
+
+
+class CrossRefBulkFetcher:
+    """Fetch many works in few requests from the crossref REST API
+
+    The DOIs are grouped into queries filtered by doi, each query
+    returns the works of the whole group as JSON.
+    """
+
+    WORKS_URL = "https://api.crossref.org/works"
+    GROUP_SIZE = 50
+
+    def __init__(self, group_size=GROUP_SIZE, mailto=None):
+        """
+        :param group_size int: number of DOIs per request
+        :param mailto str: contact email to use the crossref polite pool
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.group_size = group_size
+        self.mailto = mailto
+
+    def request_group(self, dois):
+        """Request a group of DOIs, return the list of works"""
+        params = {
+            "filter": ",".join(f"doi:{doi}" for doi in dois),
+            "rows": len(dois),
+        }
+        if self.mailto:
+            params["mailto"] = self.mailto
+        r = guarded_get(
+            self.WORKS_URL, params=params, timeout=ParserBase.TIMEOUT
+        )
+        if r is None:
+            return []
+        if not r.ok:
+            self.log.error(f"bulk request failed with status {r.status_code}")
+            return []
+        return r.json()["message"]["items"]
+
+    def fetch(self, dois):
+        """Fetch the works of the DOIs
+
+        Return the works by lower case doi, DOIs that are not
+        found are not in the dictionary.
+        :param dois list: list of cleaned DOIs
+        """
+        dois = list(dict.fromkeys(doi.lower() for doi in dois))
+        works = {}
+        for i in range(0, len(dois), self.group_size):
+            group = dois[i : i + self.group_size]
+            for work in self.request_group(group):
+                works[work["DOI"].lower()] = work
+            self.log.info(f"{len(works)}/{len(dois)} doi found in bulk")
+        return works
@@ -4,11 +4,16 @@
 """Bese configuration and command-line interface"""
 
 
-from refparse.gui import refparse_gui
-from refparse.api import RefAPI
+from refparse.daemon import send_request, serve_daemon, SOCKET_PATH
+from refparse.writers import OutputWriters
+from refparse.metrics import METRICS, format_metrics
+from refparse.logs import start_queue_logging, flush_logs, summarized_logs
 import logging
+import sqlite3
+import json
 import sys
 from shutil import copyfile
+from functools import lru_cache
 import click
 import yaml
 import os
@@ -54,6 +59,7 @@ def load_user_config():
             root_logger.warning(
                 f"unable to load user configuration due to {str(e)}"
             )
+    return FORMAT_CONFIG
 
 
 load_user_config()
@@ -67,8 +73,18 @@ CONFIG_INSTR_PATH = os.path.join(CURPATH, "user_config.yaml")
 @click.option(
     "-d/ ", "--debug/--no-debug", default=False, help="Toggle debug mode"
 )
-def cli(debug):
+@click.option(
+    "--fast-templates/--cheetah-templates",
+    default=True,
+    help="Render simple templates as Python functions instead of Cheetah",
+)
+def cli(debug, fast_templates):
     """Command-line interface for RefParse"""
+    start_queue_logging()
+    if not fast_templates:
+        from refparse import templates
+
+        templates.FAST_TEMPLATES = False
     if debug:
         click.echo("Debug mode on")
         root_logger.setLevel(logging.DEBUG)
@@ -79,6 +95,8 @@ def cli(debug):
 @click.command()
 def gui():
     """Initiate GUI for refparse"""
+    from refparse.gui import refparse_gui
+
     refparse_gui(FORMAT_CONFIG)
 
 
@@ -96,38 +114,388 @@ def config(editor):
         copyfile(CONFIG_INSTR_PATH, USR_PATH)
     click.edit(editor=editor, extension=".yaml", filename=USR_PATH)
     load_user_config()
+    send_request({"op": "reload"})
+
+
+@lru_cache(maxsize=None)
+def open_store():
+    """Open the record store, it is only opened when it is used
+
+    The store imports the parsers, a request forwarded to the daemon
+    does not open it.
+    """
+    from refparse.store import RecordStore
+
+    return RecordStore()
+
+
+@lru_cache(maxsize=None)
+def open_render_cache():
+    """Open the render cache, it is only opened when it is used"""
+    from refparse.render_cache import RenderCache
+
+    return RenderCache()
+
+
+def share_daemon_schedulers():
+    """Schedule the lookups with the schedulers of the running daemon
+
+    A batch or a crawl then keeps to the bulk share of the slots the
+    daemon's interactive lookups of the same upstreams leave over
+    """
+    if send_request({"op": "ping"}) is not None:
+        from refparse.scheduler import share_schedulers
+
+        share_schedulers(SOCKET_PATH)
+
+
+def render_results(api, formats):
+    """Render the formats of a RefAPI object"""
+    results = []
+    if api.status:
+        for ref_format in formats:
+            results.append((ref_format, api.render(ref_format)))
+    return results
+
+
+def parse_reference(
+    reference,
+    formats,
+    daemon,
+    sources=(),
+    offline=False,
+    store=False,
+    max_age=None,
+    stream=False,
+    doi_source="unixsd",
+    render_cache=False,
+):
+    """Return the rendered formats of a reference
+
+    The request is forwarded to the daemon if there is one running,
+    and the default options are used (no local sources, revalidation,
+    streaming or other doi source)
+    :param store bool: use the record store
+    :param render_cache bool: use the render cache
+    """
+    response = None
+    defaults = not sources and max_age is None and not stream
+    if daemon and defaults and doi_source == "unixsd":
+        response = send_request(
+            {
+                "op": "parse",
+                "reference": reference,
+                "formats": list(formats),
+                "store": store,
+            }
+        )
+    if response is not None:
+        flush_logs()
+        for message in response["log"]:
+            click.echo(message)
+        return response["results"]
+
+    # imported here, the daemon path does not need the parsers
+    from refparse.api import RefAPI, template_fields
+
+    api = RefAPI(
+        reference,
+        FORMAT_CONFIG,
+        sources=sources,
+        offline=offline,
+        store=open_store() if store else None,
+        max_age=max_age,
+        lean=True,
+        fields=template_fields(FORMAT_CONFIG, formats),
+        stream=stream,
+        doi_source=doi_source,
+        render_cache=open_render_cache() if render_cache else None,
+    )
+    return render_results(api, formats)
+
+
+def echo_results(results, writers=None):
+    """Echo the results, formats with an output file are written to it"""
+    flush_logs()
+    if writers is not None:
+        writers.write(results)
+        results = [result for result in results if result[0] not in writers]
+    if results:
+        click.echo("\n--- Output reference --- \n")
+        for ref_format, result in results:
+            click.echo(f"--- {ref_format}\n")
+            click.echo(result)
+
+
+def parse_outputs(ctx, param, value):
+    """Parse the FORMAT=PATH output options into a dictionary"""
+    outputs = {}
+    for output in value:
+        ref_format, sep, path = output.partition("=")
+        if not sep or not path:
+            raise click.BadParameter(f"{output} is not FORMAT=PATH")
+        outputs[ref_format] = path
+    return outputs
 
 
 @click.command()
-@click.argument("reference")
+@click.argument("references", nargs=-1)
+@click.option(
+    "-i",
+    "--input",
+    "input_file",
+    type=click.File("r"),
+    help="File with one reference per line",
+)
 @click.option(
     "-f",
     "--formats",
     multiple=True,
-    default=list(FORMAT_CONFIG.keys()),
-    help="Output template format",
+    help="Output template format, default all formats (or the outputs)",
 )
-def parse(reference, formats):
-    """Parse reference given target formats
-
-    REFERENCE is doi or arXiv ID of intended article
+@click.option(
+    "-o",
+    "--output",
+    "outputs",
+    multiple=True,
+    callback=parse_outputs,
+    help="Write a format to a file instead, e.g. -o bibtex=refs.bib",
+)
+@click.option(
+    "--daemon/--no-daemon",
+    default=True,
+    help="Forward the request to a running daemon if there is one, "
+    "batches share the lookup slots of the daemon",
+)
+@click.option(
+    "--bulk",
+    is_flag=True,
+    help="Fetch DOIs in groups from the crossref REST API",
+)
+@click.option(
+    "--upgrade",
+    is_flag=True,
+    help="Replace arXiv preprints that have a doi with the published record",
+)
+@click.option(
+    "--index",
+    "index_path",
+    type=click.Path(dir_okay=False),
+    help="Offline index that is looked up before the api",
+)
+@click.option(
+    "--pack",
+    "pack_paths",
+    multiple=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Record pack mounted read-only and looked up before the api",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    help="Only use the packs or the offline index "
+    "(default ~/.refparse/index.sqlite)",
+)
+@click.option(
+    "--store/--no-store",
+    default=True,
+    help="Use and fill the record store ~/.refparse/records.sqlite",
+)
+@click.option(
+    "--max-age",
+    type=float,
+    help="Revalidate stored records older than MAX_AGE hours",
+)
+@click.option(
+    "--render-cache/--no-render-cache",
+    default=True,
+    help="Use and fill the output cache ~/.refparse/render.sqlite",
+)
+@click.option(
+    "-p",
+    "--processes",
+    default=1,
+    help="Render the references in a pool of processes, 0 for all cores",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Stream responses and stop reading after the parsed fields",
+)
+@click.option(
+    "--doi-source",
+    type=click.Choice(["unixsd", "csl"]),
+    default="unixsd",
+    help="Request DOIs as crossref XML (unixsd) or CSL-JSON (csl)",
+)
+@click.option(
+    "--journal",
+    "journal_path",
+    type=click.Path(dir_okay=False),
+    help="Record the resolved references of the batch in a job journal",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Resume the batch of the journal, only unfinished references "
+    "are resolved",
+)
+@click.option(
+    "--metrics",
+    "show_metrics",
+    is_flag=True,
+    help="Show the request and circuit breaker metrics at the end",
+)
+def parse(
+    references,
+    input_file,
+    formats,
+    outputs,
+    daemon,
+    bulk,
+    upgrade,
+    index_path,
+    pack_paths,
+    offline,
+    store,
+    max_age,
+    render_cache,
+    processes,
+    stream,
+    doi_source,
+    journal_path,
+    resume,
+    show_metrics,
+):
+    """Parse references given target formats
+
+    REFERENCES are doi or arXiv ID of intended articles
     """
 
+    formats = list(formats or outputs or FORMAT_CONFIG.keys())
+    formats.extend(f for f in outputs if f not in formats)
     for ref_format in formats:
         if ref_format not in FORMAT_CONFIG:
             cli_logger.error(f"{ref_format} not defined")
             return
 
-    api = RefAPI(reference, FORMAT_CONFIG)
-    results = []
-    if api.status:
-        for ref_format in formats:
-            results.append((ref_format, api.render(ref_format)))
+    references = list(references)
+    if input_file:
+        references.extend(line.strip() for line in input_file if line.strip())
+    if not references:
+        cli_logger.error("no reference given")
+        return
+    if resume and not journal_path:
+        cli_logger.error("--resume requires a --journal")
+        return
 
-        click.echo("\n--- Output reference --- \n")
-        for ref_format, result in results:
-            click.echo(f"--- {ref_format}\n")
-            click.echo(result)
+    sources = []
+    if pack_paths:
+        from refparse.pack import CachePack
+
+        try:
+            sources.extend(CachePack(path) for path in pack_paths)
+        except ValueError as e:
+            cli_logger.error(str(e))
+            return
+    if index_path or (offline and not pack_paths):
+        from refparse.index import OfflineIndex, INDEX_PATH
+
+        sources.append(OfflineIndex(index_path or INDEX_PATH))
+    max_age = max_age * 3600 if max_age is not None else None
+
+    journal = None
+    if journal_path:
+        from refparse.jobs import JobJournal
+
+        try:
+            journal = JobJournal(journal_path, references, resume)
+        except ValueError as e:
+            cli_logger.error(str(e))
+            return
+
+    with OutputWriters(outputs) as writers:
+        if bulk or upgrade or processes != 1 or journal is not None:
+            from refparse.batch import RefBatch
+            from refparse.api import template_fields
+
+            if daemon:
+                share_daemon_schedulers()
+            # the per reference messages are summarized, the journal is
+            # closed (and synced) also if the batch is interrupted
+            try:
+                with summarized_logs():
+                    batch = RefBatch(
+                        references,
+                        FORMAT_CONFIG,
+                        bulk=bulk,
+                        sources=sources,
+                        offline=offline,
+                        store=open_store() if store else None,
+                        max_age=max_age,
+                        fields=template_fields(FORMAT_CONFIG, formats),
+                        stream=stream,
+                        doi_source=doi_source,
+                        render_cache=(
+                            open_render_cache() if render_cache else None
+                        ),
+                        upgrade=upgrade,
+                        journal=journal,
+                    )
+            finally:
+                if journal is not None:
+                    journal.close()
+            for results in batch.render_all(formats, processes or None):
+                echo_results(results, writers)
+        else:
+            for reference in references:
+                results = parse_reference(
+                    reference,
+                    formats,
+                    daemon,
+                    sources,
+                    offline,
+                    store,
+                    max_age,
+                    stream,
+                    doi_source,
+                    render_cache,
+                )
+                echo_results(results, writers)
+    if show_metrics:
+        click.echo(format_metrics(METRICS.snapshot()), err=True)
+
+
+@click.command()
+@click.option(
+    "--crossref",
+    multiple=True,
+    type=click.Path(exists=True),
+    help="Crossref data file (JSON, gzipped) or directory of them",
+)
+@click.option(
+    "--arxiv",
+    multiple=True,
+    type=click.Path(exists=True),
+    help="arXiv OAI-PMH dump (XML, gzipped) or directory of them",
+)
+@click.option(
+    "--index",
+    "index_path",
+    type=click.Path(dir_okay=False),
+    help="Offline index to fill (default ~/.refparse/index.sqlite)",
+)
+def ingest(crossref, arxiv, index_path):
+    """Ingest bulk metadata dumps into the offline index"""
+    from refparse.index import OfflineIndex, INDEX_PATH
+
+    index = OfflineIndex(index_path or INDEX_PATH)
+    count = index.ingest_crossref(crossref) + index.ingest_arxiv(arxiv)
+    cli_logger.info(
+        f"{count} records ingested, {index.skipped} malformed records "
+        f"skipped, {len(index)} in index"
+    )
+    index.close()
 
 
 @click.command()
@@ -137,8 +505,206 @@ def show_formats():
     click.echo(f"available formats: {fromats_}")
 
 
+@click.command()
+@click.option("--stop", is_flag=True, help="Stop the running daemon")
+@click.option(
+    "--metrics",
+    "show_metrics",
+    is_flag=True,
+    help="Show the metrics of the running daemon",
+)
+def daemon(stop, show_metrics):
+    """Run the RefParse daemon in the foreground
+
+    While the daemon runs, the parse command forwards its requests
+    to the daemon, which keeps the parsers and resolved references
+    in memory, and batches and crawls share its lookup schedulers.
+    """
+    if stop:
+        if send_request({"op": "shutdown"}) is None:
+            cli_logger.error("no running daemon found")
+        return
+    if show_metrics:
+        response = send_request({"op": "metrics"})
+        if response is None:
+            cli_logger.error("no running daemon found")
+        else:
+            click.echo(format_metrics(response["metrics"]))
+        return
+    try:
+        serve_daemon(load_user_config, store=open_store())
+    except OSError as e:
+        cli_logger.error(str(e))
+
+
+@click.command()
+@click.argument("query")
+@click.option(
+    "-f",
+    "--formats",
+    multiple=True,
+    default=list(FORMAT_CONFIG.keys())[:1],
+    help="Output template format",
+)
+@click.option(
+    "-n", "--limit", default=20, help="Maximum number of records to show"
+)
+def search(query, formats, limit):
+    """Search the title, abstract, authors and journal of stored records
+
+    QUERY uses the SQLite FTS5 syntax, e.g. "perovskite AND author:marohn"
+    """
+    for ref_format in formats:
+        if ref_format not in FORMAT_CONFIG:
+            cli_logger.error(f"{ref_format} not defined")
+            return
+
+    try:
+        apis = open_store().search_api(query, FORMAT_CONFIG, limit)
+    except sqlite3.OperationalError as e:
+        cli_logger.error(f"invalid search query: {str(e)}")
+        return
+    cli_logger.info(f"{len(apis)} records found")
+    for api in apis:
+        echo_results(render_results(api, formats))
+
+
+@click.command()
+@click.option(
+    "--max-age",
+    default=24.0,
+    help="Revalidate stored records older than MAX_AGE hours",
+)
+def refresh(max_age):
+    """Revalidate stored records with conditional requests
+
+    Records that are not modified upstream are only marked up to date,
+    modified records are parsed and replaced.
+    """
+    from refparse.api import RefAPI
+
+    store = open_store()
+    stale = store.stale(max_age * 3600)
+    for reference, _ in stale:
+        RefAPI(reference, FORMAT_CONFIG, store=store, max_age=max_age * 3600)
+    cli_logger.info(f"{len(stale)} records revalidated")
+
+
+@click.command()
+@click.argument(
+    "directory", type=click.Path(exists=True, file_okay=False), default="."
+)
+@click.option(
+    "-f",
+    "--format",
+    "ref_format",
+    default="bibtex",
+    help="Format of the bibliography entries",
+)
+@click.option(
+    "-o",
+    "--output",
+    default="references.bib",
+    help="Bibliography file, relative to DIRECTORY",
+)
+@click.option(
+    "--interval", default=0.5, help="Seconds between scans of DIRECTORY"
+)
+@click.option("--once", is_flag=True, help="Build the bibliography and exit")
+def watch(directory, ref_format, output, interval, once):
+    """Keep the bibliography of the LaTeX sources in DIRECTORY up to date
+
+    DOIs and arXiv IDs (with the arXiv: prefix) in the .tex files are
+    resolved, only changed files are rescanned and only new references
+    are resolved.
+    """
+    if ref_format not in FORMAT_CONFIG:
+        cli_logger.error(f"{ref_format} not defined")
+        return
+    from refparse.watch import BibWatcher
+
+    watcher = BibWatcher(
+        directory,
+        FORMAT_CONFIG,
+        ref_format,
+        os.path.join(directory, output),
+        store=open_store(),
+    )
+    if once:
+        watcher.update()
+    else:
+        watcher.run(interval)
+
+
+@click.command()
+@click.argument("path", type=click.Path(dir_okay=False))
+@click.argument("references", nargs=-1)
+@click.option(
+    "-i",
+    "--input",
+    "input_file",
+    type=click.File("r"),
+    help="File with one reference per line",
+)
+def export_pack(path, references, input_file):
+    """Export the record store into the pack PATH
+
+    Only the REFERENCES (and the references of the input file) are
+    exported if given, the whole store otherwise.
+    """
+    from refparse.pack import export_pack as export_records
+
+    references = list(references)
+    if input_file:
+        references.extend(line.strip() for line in input_file if line.strip())
+    export_records(open_store(), path, references or None)
+
+
+@click.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+def import_pack(path):
+    """Import the records of the pack PATH into the record store"""
+    from refparse.pack import CachePack
+
+    try:
+        pack = CachePack(path)
+    except ValueError as e:
+        cli_logger.error(str(e))
+        return
+    pack.import_into(open_store())
+    pack.close()
+
+
+@click.command()
+@click.argument("dois", nargs=-1, required=True)
+@click.option("--depth", default=1, help="Levels of citations to follow")
+@click.option("--workers", default=4, help="Maximum concurrent requests")
+@click.option("--rate", default=5.0, help="Maximum requests per second")
+@click.option("--max-records", type=int, help="Maximum DOIs to request")
+def crawl(dois, depth, workers, rate, max_records):
+    """Crawl the citation graph of DOIS breadth-first
+
+    Records and citation edges are written to the standard output as JSON
+    lines, in the order they are resolved.
+    """
+    from refparse.crawl import Crawler
+
+    share_daemon_schedulers()
+    crawler = Crawler(depth, workers, rate, max_records)
+    for event in crawler.crawl(dois):
+        click.echo(json.dumps(event))
+
+
 # add commend the the commend line interface
 cli.add_command(gui)
 cli.add_command(parse)
 cli.add_command(config)
 cli.add_command(show_formats)
+cli.add_command(daemon)
+cli.add_command(ingest)
+cli.add_command(search)
+cli.add_command(refresh)
+cli.add_command(watch)
+cli.add_command(export_pack)
+cli.add_command(import_pack)
+cli.add_command(crawl)
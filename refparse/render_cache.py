@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Persistent cache of rendered output
+
+The output is keyed by the hash of the parsed fields and the hash of
+the template source, an output is reused as long as neither the record
+nor the template changed. Editing a format only misses the cache of
+that format. The template hash is salted with the renderer (the
+versions of refparse and of the libraries used by the filters, the
+source of the filters and of the fast templates, and whether the fast
+templates are on), so an upgrade does not serve stale output. The
+cache keeps the MAX_ENTRIES most recently saved outputs.
+"""
+
+
+from refparse import templates, utils
+from functools import lru_cache
+import threading
+import inspect
+import time
+import hashlib
+import logging
+import sqlite3
+import json
+import os
+
+try:
+    from importlib.metadata import version, PackageNotFoundError
+except ImportError:  # Python < 3.8
+    from pkg_resources import get_distribution
+    from pkg_resources import DistributionNotFound as PackageNotFoundError
+
+    def version(name):
+        return get_distribution(name).version
+
+
+cache_logger = logging.getLogger("RenderCache")
+
+RENDER_CACHE_PATH = os.path.join(
+    os.path.expanduser("~/.refparse"), "render.sqlite"
+)
+
+# distributions the rendered output depends on
+RENDERER_DISTRIBUTIONS = ("refparse", "Cheetah3", "pylatexenc", "titlecase")
+
+
+def record_hash(parsed):
+    """Hash of the parsed fields, independent of the key order"""
+    data = json.dumps(parsed, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _renderer_version():
+    """Versions of the distributions and hash of the renderer source"""
+    versions = []
+    for name in RENDERER_DISTRIBUTIONS:
+        try:
+            versions.append(f"{name}=={version(name)}")
+        except PackageNotFoundError:
+            # e.g. refparse run from a checkout
+            versions.append(f"{name}==unknown")
+    source = hashlib.sha256()
+    for module in (utils, templates):
+        try:
+            source.update(inspect.getsource(module).encode("utf-8"))
+        except OSError:
+            # no source (e.g. a frozen application), the version decides
+            pass
+    versions.append(source.hexdigest())
+    return ";".join(versions)
+
+
+def renderer_salt():
+    """Salt of the template hash, changes with the renderer"""
+    backend = "fast" if templates.FAST_TEMPLATES else "cheetah"
+    return f"{_renderer_version()};{backend}"
+
+
+@lru_cache(maxsize=None)
+def template_hash(source, salt=""):
+    """Hash of the template source, salted with the renderer"""
+    data = f"{salt}\n{source}"
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """SQLite cache of rendered output"""
+
+    MAX_ENTRIES = 100000
+    # rows saved between two prunes
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path=RENDER_CACHE_PATH, max_entries=MAX_ENTRIES):
+        """
+        :param path str: path of the SQLite database
+        :param max_entries int: outputs kept, the oldest are pruned
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.saved = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        columns = [
+            row[1] for row in self.conn.execute("PRAGMA table_info(outputs)")
+        ]
+        if columns and "saved" not in columns:
+            # cache of an earlier version, the outputs are disposable
+            self.conn.execute("DROP TABLE outputs")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS outputs ("
+            "record_hash TEXT, template_hash TEXT, output TEXT, saved REAL, "
+            "PRIMARY KEY (record_hash, template_hash)"
+            ") WITHOUT ROWID"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS outputs_saved ON outputs (saved)"
+        )
+        self.prune()
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, record_key, source):
+        """Return the output of the record and template, None if missed
+
+        :param record_key str: hash of the parsed fields (see record_hash)
+        :param source str: template source
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT output FROM outputs "
+                "WHERE record_hash = ? AND template_hash = ?",
+                (record_key, template_hash(source, renderer_salt())),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, record_key, source, output):
+        self.put_many([(record_key, source, output)])
+
+    def put_many(self, rows):
+        """Save (record_key, source, output) rows in one transaction"""
+        salt = renderer_salt()
+        now = time.time()
+        rows = [
+            (record_key, template_hash(source, salt), output, now)
+            for record_key, source, output in rows
+        ]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)", rows
+            )
+            self.saved += len(rows)
+        if self.saved >= self.PRUNE_EVERY:
+            self.prune()
+
+    def prune(self):
+        """Delete the oldest outputs beyond max_entries"""
+        with self.lock, self.conn:
+            self.saved = 0
+            deleted = self.conn.execute(
+                "DELETE FROM outputs WHERE saved <= ("
+                "SELECT saved FROM outputs ORDER BY saved DESC "
+                "LIMIT 1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        if deleted:
+            cache_logger.debug(f"{deleted} outputs pruned")
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM outputs"
+            ).fetchone()[0]
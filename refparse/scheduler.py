@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Priority scheduling of the upstream lookups
+
+Each upstream (host) has a scheduler that admits at most SLOTS
+concurrent lookups. A lookup belongs to the priority class of its
+thread, interactive by default (e.g. a search in the GUI or a daemon
+request); batches, crawls and prefetches run as bulk. Free slots go to
+the waiting interactive lookups first. While interactive lookups are
+queued or running, bulk lookups only use their share of the slots, so an
+interactive lookup does not queue behind a running batch; otherwise
+bulk lookups borrow all the slots.
+
+The schedulers live in a process. While the daemon runs, the batches
+and crawls of the command-line interface share its schedulers (see
+share_schedulers): each lookup holds a slot of the daemon's scheduler
+over a connection to its socket, and the slot is released when the
+connection is closed, also if the process dies.
+"""
+
+
+from refparse.metrics import METRICS
+from urllib.parse import urlsplit
+from contextlib import contextmanager, ExitStack
+from collections import Counter, deque
+import threading
+import socket
+import json
+import time
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+# in order of priority
+PRIORITIES = (INTERACTIVE, BULK)
+
+_state = threading.local()
+
+
+def current_priority():
+    """Priority class of the lookups of the current thread"""
+    return getattr(_state, "priority", INTERACTIVE)
+
+
+@contextmanager
+def lookup_priority(priority):
+    """Run the lookups of the current thread with the priority class"""
+    previous = current_priority()
+    _state.priority = priority
+    try:
+        yield
+    finally:
+        _state.priority = previous
+
+
+class LookupScheduler:
+    """Admit the lookups of a single upstream by priority class"""
+
+    SLOTS = 8
+    # fraction of the slots a class may use while lookups of a higher
+    # priority class are queued or running
+    SHARES = {INTERACTIVE: 1.0, BULK: 0.75}
+
+    def __init__(self, name, slots=SLOTS, shares=None):
+        """
+        :param name str: name of the upstream, used in the metrics
+        :param slots int: maximum number of concurrent lookups
+        :param shares dict: fraction of the slots per priority class
+        """
+        self.name = name
+        self.slots = slots
+        shares = shares or self.SHARES
+        self.limits = {
+            priority: max(1, int(slots * shares[priority]))
+            for priority in PRIORITIES
+        }
+        self.lock = threading.Lock()
+        self.queues = {priority: deque() for priority in PRIORITIES}
+        self.running = Counter()
+
+    def acquire(self, priority):
+        """Wait for a slot"""
+        start = time.monotonic()
+        granted = threading.Event()
+        with self.lock:
+            self.queues[priority].append(granted)
+            self.dispatch()
+        granted.wait()
+        wait_ms = round((time.monotonic() - start) * 1000)
+        METRICS.increment(f"scheduler.{self.name}.{priority}.lookups")
+        METRICS.increment(f"scheduler.{self.name}.{priority}.wait_ms", wait_ms)
+
+    def release(self, priority):
+        with self.lock:
+            self.running[priority] -= 1
+            self.dispatch()
+
+    def limit(self, priority):
+        """Slots the priority class may use
+
+        The class keeps to its share while a higher priority class has
+        lookups queued or running, it borrows the idle slots otherwise.
+        Called with the lock held
+        """
+        for higher in PRIORITIES[: PRIORITIES.index(priority)]:
+            if self.queues[higher] or self.running[higher]:
+                return self.limits[priority]
+        return self.slots
+
+    def dispatch(self):
+        """Grant the free slots to the waiting lookups, in priority order
+
+        Called with the lock held
+        """
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            while (
+                queue
+                and sum(self.running.values()) < self.slots
+                and self.running[priority] < self.limit(priority)
+            ):
+                self.running[priority] += 1
+                queue.popleft().set()
+            METRICS.set_gauge(
+                f"scheduler.{self.name}.{priority}.queued", len(queue)
+            )
+
+    @contextmanager
+    def slot(self, priority=None):
+        """Hold a slot, of the priority class of the thread by default"""
+        priority = priority or current_priority()
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+
+SCHEDULERS = {}
+_schedulers_lock = threading.Lock()
+# path of the socket of the daemon whose schedulers are shared
+_shared = {"path": None}
+
+
+def upstream_name(url):
+    return urlsplit(url).hostname or url
+
+
+def get_scheduler(url):
+    """Return the scheduler of the upstream of the url"""
+    name = upstream_name(url)
+    with _schedulers_lock:
+        if name not in SCHEDULERS:
+            SCHEDULERS[name] = LookupScheduler(name)
+        return SCHEDULERS[name]
+
+
+def reset_schedulers():
+    """Forget the schedulers of all upstreams"""
+    with _schedulers_lock:
+        SCHEDULERS.clear()
+    _shared["path"] = None
+
+
+def share_schedulers(path):
+    """Schedule the lookups with the schedulers of the daemon on path
+
+    :param path str: path of the unix socket, None to use the schedulers
+        of this process again
+    """
+    _shared["path"] = path
+
+
+@contextmanager
+def remote_slot(path, name, priority, timeout=5):
+    """Hold a slot of the scheduler of the daemon listening on path
+
+    Yield True once the slot is granted, False if no daemon is
+    reachable. The slot is released when the connection is closed.
+    :param name str: name of the upstream
+    :param timeout float: socket timeout of the connection, the wait
+        for the slot itself is not limited
+    """
+    granted = False
+    sock = None
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(path)
+        request = {"op": "slot", "upstream": name, "priority": priority}
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        sock.settimeout(None)
+        with sock.makefile("rb") as stream:
+            line = stream.readline()
+        granted = bool(line) and json.loads(line).get("status", False)
+    except (AttributeError, OSError, ValueError):
+        # no unix sockets on this platform, or no daemon
+        pass
+    try:
+        yield granted
+    finally:
+        if sock is not None:
+            sock.close()
+
+
+@contextmanager
+def upstream_slot(url):
+    """Hold a slot of the scheduler of the upstream of the url
+
+    The slot is of the priority class of the thread, of the daemon's
+    scheduler if they are shared and the daemon is reachable.
+    """
+    priority = current_priority()
+    path = _shared["path"]
+    with ExitStack() as stack:
+        if path is None or not stack.enter_context(
+            remote_slot(path, upstream_name(url), priority)
+        ):
+            stack.enter_context(get_scheduler(url).slot(priority))
+        yield
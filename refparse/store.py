@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Local store of resolved records with full-text search
+
+Every record resolved by RefAPI with a store is saved as the parsed
+fields (see ParserBase.record), with the validators (ETag and
+Last-Modified) of the response to revalidate the record later.
+A record parsed with selected fields (see template_fields) is saved
+with its field set, it only serves requests for a subset of the fields
+and is replaced when more fields are requested.
+The title, abstract, authors and journal are indexed with SQLite FTS5,
+search results are ranked with bm25.
+"""
+
+
+from refparse.api import RefAPI, api_method
+from refparse.index import canonical_key
+import threading
+import logging
+import sqlite3
+import json
+import time
+import os
+
+store_logger = logging.getLogger("Store")
+
+STORE_PATH = os.path.join(os.path.expanduser("~/.refparse"), "records.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL,
+    api_type TEXT NOT NULL,
+    reference TEXT NOT NULL,
+    record TEXT NOT NULL,
+    updated REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fields TEXT,
+    UNIQUE (key, api_type)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(
+    title, abstract, author, journal, tokenize = 'unicode61'
+);
+"""
+
+
+# bm25 weights of the title, abstract, author and journal columns
+SEARCH_WEIGHTS = (10.0, 1.0, 5.0, 2.0)
+
+
+def search_fields(record):
+    """The text of a record indexed for the full-text search"""
+    author = "; ".join(" ".join(name) for name in record.get("author", []))
+    journal = " ".join(
+        [
+            record.get("journal_full_title", ""),
+            record.get("journal_abbrev_title", ""),
+        ]
+    )
+    return (
+        record.get("title", ""),
+        record.get("abstract", ""),
+        author,
+        journal.strip(),
+    )
+
+
+def covers(stored, fields):
+    """Check if a record parsed with the stored fields has the fields
+
+    :param stored list: fields of the stored record, None if complete
+    :param fields set: requested fields, None for all fields
+    """
+    if stored is None:
+        return True
+    return fields is not None and fields.issubset(stored)
+
+
+class RecordStore:
+    """SQLite store of parsed records
+
+    The store can be shared between threads (e.g. in the daemon).
+    """
+
+    def __init__(self, path=STORE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        columns = [
+            row[1] for row in self.conn.execute("PRAGMA table_info(records)")
+        ]
+        if "fields" not in columns:
+            # store of an earlier version, its records are complete
+            with self.conn:
+                self.conn.execute("ALTER TABLE records ADD COLUMN fields TEXT")
+
+    def close(self):
+        self.conn.close()
+
+    def lookup(self, reference, api_type, fields=None):
+        """Return the parsed record of the reference, None if not found
+
+        :param fields set: fields the record must have, all if None
+        """
+        entry = self.entry(reference, api_type, fields)
+        return entry["record"] if entry else None
+
+    def entry(self, reference, api_type, fields=None):
+        """Return the record with its validators and update time
+
+        :param fields set: fields the record must have, all if None
+        :return dict: with record, validators, updated and fields keys,
+            None if the reference is not stored with the fields
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT record, etag, last_modified, updated, fields "
+                "FROM records WHERE key = ? AND api_type = ?",
+                (canonical_key(reference, api_type), api_type),
+            ).fetchone()
+        if row is None:
+            return None
+        stored = json.loads(row[4]) if row[4] is not None else None
+        if not covers(stored, fields):
+            return None
+        return {
+            "record": json.loads(row[0]),
+            "validators": {"etag": row[1], "last_modified": row[2]},
+            "updated": row[3],
+            "fields": set(stored) if stored is not None else None,
+        }
+
+    def touch(self, reference, api_type):
+        """Mark the record as up to date, e.g. after a 304 response"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE records SET updated = ? WHERE key = ? AND api_type = ?",
+                (time.time(), canonical_key(reference, api_type), api_type),
+            )
+
+    def stale(self, max_age):
+        """List (reference, api_type) of records older than max_age seconds"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT reference, api_type FROM records WHERE updated < ? "
+                "ORDER BY updated",
+                (time.time() - max_age,),
+            ).fetchall()
+
+    def save(self, reference, api_type, record, validators=None, fields=None):
+        """Save or replace the record and its search index entry
+
+        :param fields set: fields the record was parsed with, None if
+            the record is complete
+        """
+        key = canonical_key(reference, api_type)
+        validators = validators or {}
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT id FROM records WHERE key = ? AND api_type = ?",
+                (key, api_type),
+            ).fetchone()
+            if row:
+                self.conn.execute(
+                    "DELETE FROM records_fts WHERE rowid = ?", (row[0],)
+                )
+            cursor = self.conn.execute(
+                "INSERT OR REPLACE INTO records (id, key, api_type, "
+                "reference, record, updated, etag, last_modified, fields) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    row[0] if row else None,
+                    key,
+                    api_type,
+                    reference,
+                    json.dumps(record),
+                    time.time(),
+                    validators.get("etag"),
+                    validators.get("last_modified"),
+                    json.dumps(sorted(fields)) if fields is not None else None,
+                ),
+            )
+            self.conn.execute(
+                "INSERT INTO records_fts "
+                "(rowid, title, abstract, author, journal) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (cursor.lastrowid,) + search_fields(record),
+            )
+
+    def records(self):
+        """List (reference, api_type, record) of the complete records"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT reference, api_type, record FROM records "
+                "WHERE fields IS NULL ORDER BY id"
+            ).fetchall()
+        return [
+            (reference, api_type, json.loads(record))
+            for reference, api_type, record in rows
+        ]
+
+    def search(self, query, limit=20):
+        """Full-text search of the records, best match first
+
+        The query uses the FTS5 syntax, e.g. "perovskite AND author:marohn"
+        Return a list of (reference, api_type, record) tuples.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT r.reference, r.api_type, r.record "
+                "FROM records_fts JOIN records r ON r.id = records_fts.rowid "
+                "WHERE records_fts MATCH ? "
+                "ORDER BY bm25(records_fts, ?, ?, ?, ?) LIMIT ?",
+                (query,) + SEARCH_WEIGHTS + (limit,),
+            ).fetchall()
+        return [
+            (reference, api_type, json.loads(record))
+            for reference, api_type, record in rows
+        ]
+
+    def search_api(self, query, format_template, limit=20):
+        """Full-text search returning RefAPI objects to render"""
+        apis = []
+        for reference, api_type, record in self.search(query, limit):
+            parser = api_method[api_type](reference, record=record)
+            apis.append(RefAPI(reference, format_template, parser=parser))
+        return apis
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM records"
+            ).fetchone()[0]
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Fast path for simple Cheetah templates
+
+Templates that only use #set, #if/#elif/#else, ## comments, $name
+placeholders and Python expressions on the fields (e.g. the shipped md,
+rst and text formats) are translated into a plain Python function,
+which looks up the names directly instead of through the Cheetah name
+mapper. Any other template raises UnsupportedTemplate and is rendered
+by Cheetah (see compile_template). The translation follows the code
+Cheetah generates: the #set names are locals, other names are looked up
+in the FN filters then the parsed fields, None is written as "".
+"""
+
+
+from refparse.utils import Filters
+from Cheetah.Template import Template
+import builtins
+import keyword
+import re
+
+# the translated templates are used, see compile_template
+FAST_TEMPLATES = True
+
+NAME = r"[A-Za-z_]\w*"
+SET_PATTERN = re.compile(rf"#set\s+\$({NAME})\s*=(?!=)\s*(.+)$")
+IF_PATTERN = re.compile(r"#(if|elif)\s+(.+)$")
+END_PATTERN = re.compile(r"#end\s+if$")
+EXPR_TOKEN = re.compile(
+    r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")"""
+    rf"|\$({NAME})(\.{NAME})?"
+    rf"|(?<![.\w])({NAME})"
+    r"|([$#'\"\\])"
+)
+FOR_PATTERN = re.compile(rf"\bfor\s+((?:{NAME}|[\s,()])+?)\s+in\b")
+PLACEHOLDER_TOKEN = re.compile(rf"\$({NAME})")
+# text that Cheetah may parse as something else than a $name placeholder
+TEXT_UNSUPPORTED = re.compile(
+    rf"\$(?!{NAME})|\${NAME}(?:[\[(]|\.{NAME})|#[A-Za-z_{{#*]|\\"
+)
+
+# names the generated Cheetah method finds before the search list: its
+# locals and the attributes of the template object
+RESERVED = {"self", "trans", "write", "SL", "FN"} | set(dir(Template))
+
+
+class UnsupportedTemplate(ValueError):
+    """The template uses more than the fast path subset"""
+
+
+class FastTemplate:
+    """A template translated into a Python function"""
+
+    def __init__(self, source):
+        """Translate the template
+
+        :param source str: Cheetah template source
+        """
+        self.source = source
+        self.code = translate(source)
+        namespace = {"FN": Filters, "_lookup": lookup, "_text": text}
+        exec(compile(self.code, "<template>", "exec"), namespace)
+        self.function = namespace["render"]
+
+    def render(self, parsed):
+        """Render the parsed fields
+
+        Raise an exception if a name is not found, the template is then
+        rendered by Cheetah (see render_template)
+        """
+        return self.function(parsed)
+
+
+class NameNotFound(LookupError):
+    """The name is not in the locals, the filters or the fields"""
+
+
+def lookup(local, parsed, name):
+    if name in local:
+        value = local[name]
+    else:
+        try:
+            value = parsed[name]
+        except KeyError:
+            # Cheetah also searches the module and builtin names
+            raise NameNotFound(name)
+    if callable(value) and not isinstance(value, type):
+        # Cheetah calls callable values
+        raise NameNotFound(name)
+    return value
+
+
+def text(value):
+    return "" if value is None else str(value)
+
+
+def check_name(name):
+    if name in RESERVED or name.startswith("_") or keyword.iskeyword(name):
+        raise UnsupportedTemplate(f"${name} is reserved")
+
+
+def translate_expression(expr, set_names):
+    """Translate a directive expression into Python
+
+    :param set_names set: names of the #set locals
+    """
+    names, bare = set(), set()
+
+    def replace(match):
+        string, name, attr, bare_name, other = match.groups()
+        if string:
+            return string
+        elif bare_name:
+            bare.add(bare_name)
+            return bare_name
+        elif other:
+            raise UnsupportedTemplate(f"{other} in {expr}")
+        elif name == "FN":
+            if attr and not hasattr(Filters, attr[1:]):
+                raise UnsupportedTemplate(f"$FN{attr} is not a filter")
+            return "FN" + (attr or "")
+        elif attr:
+            raise UnsupportedTemplate(f"${name}{attr} in {expr}")
+        check_name(name)
+        names.add(name)
+        return f"_lookup(_local, parsed, {name!r})"
+
+    code = EXPR_TOKEN.sub(replace, expr)
+    bound = set()
+    for targets in FOR_PATTERN.findall(expr):
+        bound.update(re.findall(NAME, targets))
+    # in a comprehension, Cheetah looks up the names in its frame
+    if names & bound or (bound and names & set_names):
+        raise UnsupportedTemplate(f"$name in a comprehension in {expr}")
+    # bare names are Python names, only builtins and loop variables
+    for name in bare - bound:
+        if keyword.iskeyword(name):
+            continue
+        if not hasattr(builtins, name) or name in set_names:
+            raise UnsupportedTemplate(f"{name} in {expr}")
+    try:
+        compile(code, "<template>", "eval")
+    except SyntaxError:
+        raise UnsupportedTemplate(f"invalid expression {expr}")
+    return code
+
+
+def translate(source):
+    """Translate the template source into a render(parsed) function
+
+    Raise UnsupportedTemplate if the template uses anything else than
+    the fast path subset.
+    """
+    lines = source.splitlines(keepends=True)
+    set_names = set()
+    for line in lines:
+        match = SET_PATTERN.match(line.strip())
+        if match:
+            set_names.add(match.group(1))
+
+    code = ["def render(parsed):", "    _local = {}", "    _out = []"]
+    depth = 1
+    # whether the last block is empty, Cheetah does not compile it
+    empty = False
+    for line in lines:
+        directive = line.strip()
+        indent = "    " * depth
+        if directive.startswith("##"):
+            continue
+        elif directive.startswith("#"):
+            set_match = SET_PATTERN.match(directive)
+            if_match = IF_PATTERN.match(directive)
+            if set_match:
+                name, expr = set_match.groups()
+                check_name(name)
+                expr = translate_expression(expr, set_names)
+                code.append(f"{indent}_local[{name!r}] = {expr}")
+                empty = False
+            elif if_match:
+                keyword_, expr = if_match.groups()
+                if keyword_ == "elif":
+                    if depth == 1:
+                        raise UnsupportedTemplate("#elif without #if")
+                    if empty:
+                        raise UnsupportedTemplate("empty #if block")
+                    indent = "    " * (depth - 1)
+                else:
+                    depth += 1
+                expr = translate_expression(expr, set_names)
+                code.append(f"{indent}{keyword_} {expr}:")
+                empty = True
+            elif directive == "#else":
+                if depth == 1:
+                    raise UnsupportedTemplate("#else without #if")
+                if empty:
+                    raise UnsupportedTemplate("empty #if block")
+                code.append("    " * (depth - 1) + "else:")
+                empty = True
+            elif END_PATTERN.match(directive):
+                if depth == 1:
+                    raise UnsupportedTemplate("#end if without #if")
+                if empty:
+                    raise UnsupportedTemplate("empty #if block")
+                depth -= 1
+                empty = False
+            else:
+                raise UnsupportedTemplate(f"unsupported directive {line}")
+        else:
+            if TEXT_UNSUPPORTED.search(line) or "##" in line:
+                raise UnsupportedTemplate(f"unsupported text {line}")
+            position = 0
+            for match in PLACEHOLDER_TOKEN.finditer(line):
+                check_name(match.group(1))
+                if match.start() > position:
+                    literal = line[position : match.start()]
+                    code.append(f"{indent}_out.append({literal!r})")
+                code.append(
+                    f"{indent}_out.append(_text(_lookup(_local, parsed, "
+                    f"{match.group(1)!r})))"
+                )
+                position = match.end()
+            if position < len(line):
+                code.append(f"{indent}_out.append({line[position:]!r})")
+            empty = False
+    if depth != 1:
+        raise UnsupportedTemplate("#if without #end if")
+    code.append("    return ''.join(_out)")
+    return "\n".join(code) + "\n"
@@ -7,6 +7,7 @@
 from pylatexenc.latexencode import unicode_to_latex
 from calendar import month_abbr, month_name
 from titlecase import titlecase
+from lxml import etree
 import re
 import bs4
 from collections import defaultdict
@@ -53,6 +54,34 @@ def get_string(obj, path):
         return ""
 
 
+def html_pieces(tag_element):
+    """Iterate over the children of a tag element
+
+    Yield the strings, and (tag, text, html) tuples for the tags
+    :param tag_element: bs4 tag, or lxml element (e.g. of a streamed
+        response), of which the namespaces are dropped
+    """
+    if isinstance(tag_element, etree._Element):
+        if tag_element.text:
+            yield tag_element.text
+        for child in tag_element:
+            if isinstance(child.tag, str):
+                name = etree.QName(child).localname
+                text = "".join(child.itertext())
+                yield name, text, f"<{name}>{text}</{name}>"
+            if child.tail:
+                yield child.tail
+        return
+
+    tag_pattern = re.compile(r"<\w+\s*\w*>(.+)</(\w+)>")
+    for ele in tag_element:
+        if not isinstance(ele, bs4.element.Tag):
+            yield ele
+        else:
+            subtag = re.match(tag_pattern, str(ele))
+            yield subtag.group(2), subtag.group(1), str(ele)
+
+
 def html_convert(tag_element):
     """extract the html content of the tag element
 
@@ -60,7 +89,7 @@ def html_convert(tag_element):
     as the browser. Currently this function is limited.
 
     :param tag_element bs4.element.tag: tag to extract content
-        This should be a soup object
+        This should be a soup object (or an lxml element)
     """
 
     _html_to_latex_tags = defaultdict(lambda: ("", ""))
@@ -82,22 +111,19 @@ def html_convert(tag_element):
     content = []
     content_html = []
     content_latex = []
-    tag_pattern = re.compile(r"<\w+\s*\w*>(.+)</(\w+)>")
 
-    for ele in tag_element:
-        if not isinstance(ele, bs4.element.Tag):
+    for ele in html_pieces(tag_element):
+        if isinstance(ele, str):
             str_ = re.sub(r"([\n].+[\n])\s+", r"\1", ele)
             str_ = re.sub(r"\s+", " ", str_.replace("\n", " "))
             content.append(str_)
             content_html.append(str_)
             content_latex.append(str_)
         else:
-            subtag = re.match(tag_pattern, str(ele))
-            text = subtag.group(1)
-            tag = subtag.group(2)
+            tag, text, html = ele
 
             content.append(text)
-            content_html.append(str(ele))
+            content_html.append(html)
             latex = "{latex[0]}{text}{latex[1]}".format(
                 latex=_html_to_latex_tags[tag], text=text,
             )
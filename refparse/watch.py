@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Incremental bibliography builds of LaTeX projects
+
+The watcher polls a project directory for .tex files, only rescans the
+files that changed since the last poll, only resolves the references
+that newly appear, and rewrites the bibliography when the set of
+references changed.
+"""
+
+
+from refparse.api import (
+    RefAPI,
+    DOI_PATTERN,
+    ARXIV_PATTERN1,
+    ARXIV_PATTERN2,
+    template_fields,
+)
+from refparse.writers import AtomicWriter
+import logging
+import time
+import os
+import re
+
+watch_logger = logging.getLogger("Watch")
+
+# arXiv IDs look like other numbers, they need the arXiv prefix in sources
+ARXIV_TEX_PATTERN = re.compile(
+    rf"arXiv:\s*({ARXIV_PATTERN1.pattern}|{ARXIV_PATTERN2.pattern})",
+    re.IGNORECASE,
+)
+COMMENT_PATTERN = re.compile(r"(?<!\\)%.*")
+
+
+def strip_doi(doi):
+    """Strip the punctuation of the sentence that follows a doi
+
+    Parentheses are allowed in DOIs, a closing one is only kept if it
+    is balanced.
+    """
+    while True:
+        doi = doi.rstrip(".,;:")
+        if doi.endswith(")") and doi.count(")") > doi.count("("):
+            doi = doi[:-1]
+        else:
+            return doi
+
+
+def find_references(text):
+    """List the DOIs and arXiv IDs of a LaTeX source in order
+
+    Commented out references are ignored.
+    """
+    text = COMMENT_PATTERN.sub("", text)
+    found = []
+    for match in DOI_PATTERN.finditer(text):
+        found.append((match.start(), strip_doi(match.group(0))))
+    for match in ARXIV_TEX_PATTERN.finditer(text):
+        found.append((match.start(), match.group(1)))
+    return list(dict.fromkeys(reference for _, reference in sorted(found)))
+
+
+class BibWatcher:
+    """Keep the bibliography of a directory of LaTeX sources up to date"""
+
+    # seconds before a failed reference is resolved again, doubled after
+    # every failure up to MAX_RETRY_DELAY
+    RETRY_DELAY = 5
+    MAX_RETRY_DELAY = 300
+
+    def __init__(
+        self,
+        directory,
+        format_template,
+        ref_format,
+        output,
+        store=None,
+        extensions=(".tex",),
+    ):
+        """
+        :param directory str: project directory, walked recursively
+        :param format_template dict: format configuration
+        :param ref_format str: format of the bibliography entries
+        :param output str: path of the bibliography
+        :param store RecordStore: store used to resolve the references
+        :param extensions tuple: suffixes of the scanned files
+        """
+        self.directory = directory
+        self.format_template = format_template
+        self.ref_format = ref_format
+        self.output = output
+        self.store = store
+        self.extensions = extensions
+        self.fields = template_fields(format_template, [ref_format])
+        # path -> (mtime_ns, size, references) of the last scan
+        self.files = {}
+        # reference -> rendered entry of the resolved references
+        self.entries = {}
+        # reference -> (failures, monotonic time of the next attempt)
+        self.failures = {}
+        self.written = None
+
+    def source_files(self):
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if name.endswith(self.extensions):
+                    yield os.path.join(root, name)
+
+    def scan(self):
+        """Rescan the changed files, return True if any file changed"""
+        changed = False
+        seen = set()
+        for path in self.source_files():
+            seen.add(path)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            previous = self.files.get(path)
+            if previous and previous[:2] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                references = find_references(f.read())
+            self.files[path] = (stat.st_mtime_ns, stat.st_size, references)
+            watch_logger.debug(f"{path} scanned")
+            changed = True
+        for path in set(self.files) - seen:
+            del self.files[path]
+            changed = True
+        return changed
+
+    def references(self):
+        """References of all files, in order of the sorted paths"""
+        references = []
+        for path in sorted(self.files):
+            references.extend(self.files[path][2])
+        return list(dict.fromkeys(references))
+
+    def resolve(self, reference):
+        api = RefAPI(
+            reference,
+            self.format_template,
+            store=self.store,
+            lean=True,
+            fields=self.fields,
+        )
+        return api.render(self.ref_format) if api.status else None
+
+    def retry_due(self):
+        """Check if a failed reference is to be resolved again"""
+        now = time.monotonic()
+        return any(due <= now for _, due in self.failures.values())
+
+    def update(self):
+        """Rescan, resolve the new references and write the bibliography
+
+        References that failed (e.g. a network error, or a doi that was
+        saved half typed) are retried with an exponential backoff.
+        Return True if the bibliography was written
+        """
+        changed = self.scan()
+        if not changed and self.written is not None and not self.retry_due():
+            return False
+        references = self.references()
+        now = time.monotonic()
+        for reference in references:
+            if reference in self.entries:
+                continue
+            failures, due = self.failures.get(reference, (0, now))
+            if due > now:
+                continue
+            entry = self.resolve(reference)
+            if entry is not None:
+                self.entries[reference] = entry
+                self.failures.pop(reference, None)
+            else:
+                delay = min(
+                    self.RETRY_DELAY * 2 ** failures, self.MAX_RETRY_DELAY
+                )
+                self.failures[reference] = (failures + 1, now + delay)
+        # the references removed from the sources are not retried
+        for reference in set(self.failures) - set(references):
+            del self.failures[reference]
+        entries = [
+            self.entries[reference]
+            for reference in references
+            if reference in self.entries
+        ]
+        if entries == self.written:
+            return False
+        with AtomicWriter(self.output) as writer:
+            for entry in entries:
+                writer.write(entry)
+        self.written = entries
+        return True
+
+    def run(self, interval=0.5):
+        """Poll the directory until interrupted"""
+        watch_logger.info(f"watching {self.directory}, writing {self.output}")
+        try:
+            while True:
+                self.update()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            watch_logger.info("watch stopped")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Buffered writers for rendered output files
+
+The results are appended to a temporary file next to the target as they
+complete, the file is flushed and synced every few entries and renamed to
+the target on completion, so the target is either the old or the
+complete new file.
+"""
+
+
+import tempfile
+import logging
+import os
+
+writer_logger = logging.getLogger("Writer")
+
+
+def target_mode(path):
+    """Permissions of the target, of a new file if it does not exist
+
+    The temporary file is only readable by the user
+    """
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+class AtomicWriter:
+    """Buffered writer of entries that replaces the target on commit"""
+
+    def __init__(self, path, buffer_size=1 << 16, sync_every=1000):
+        """Open the temporary file
+
+        :param path str: target file
+        :param buffer_size int: size of the write buffer in bytes
+        :param sync_every int: number of entries between flush and fsync
+        """
+        self.path = path
+        self.sync_every = sync_every
+        self.count = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, self.temp_path = tempfile.mkstemp(
+            dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+        )
+        self.file = open(fd, "w", encoding="utf-8", buffering=buffer_size)
+        self.mode = target_mode(path)
+
+    def write(self, entry):
+        """Append an entry, entries are separated by a blank line"""
+        if self.count:
+            self.file.write("\n")
+        self.file.write(entry if entry.endswith("\n") else entry + "\n")
+        self.count += 1
+        if self.count % self.sync_every == 0:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def commit(self):
+        """Sync and move the temporary file to the target"""
+        self.sync()
+        self.file.close()
+        os.chmod(self.temp_path, self.mode)
+        os.replace(self.temp_path, self.path)
+        writer_logger.info(f"{self.count} entries written to {self.path}")
+
+    def abort(self):
+        """Remove the temporary file, the target is unchanged"""
+        self.file.close()
+        os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class OutputWriters:
+    """Writers of the formats that have an output file"""
+
+    def __init__(self, outputs, **kwargs):
+        """
+        :param outputs dict: output file path by format
+        :param kwargs: passed to the AtomicWriter
+        """
+        self.writers = {}
+        try:
+            for ref_format, path in outputs.items():
+                self.writers[ref_format] = AtomicWriter(path, **kwargs)
+        except OSError:
+            self.abort()
+            raise
+
+    def __contains__(self, ref_format):
+        return ref_format in self.writers
+
+    def write(self, results):
+        """Write the (format, result) pairs that have an output file"""
+        for ref_format, result in results:
+            if ref_format in self.writers:
+                self.writers[ref_format].write(result)
+
+    def commit(self):
+        for writer in self.writers.values():
+            writer.commit()
+
+    def abort(self):
+        for writer in self.writers.values():
+            writer.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.breaker import reset_breakers
+from refparse.scheduler import reset_schedulers
+from refparse.metrics import METRICS
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def reset_upstreams():
+    """Every test starts with closed breakers and empty metrics"""
+    reset_breakers()
+    reset_schedulers()
+    METRICS.reset()
+    yield
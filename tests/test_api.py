@@ -2,7 +2,8 @@
 # -*- coding: utf-8 -*-
 
 
-from refparse.api import RefAPI
+from refparse.api import RefAPI, template_fields
+from refparse.parser import CrossRefParser, CrossRefCSLParser, arXivParser
 from unittest.mock import patch, Mock
 import logging
 import os
@@ -41,6 +42,7 @@ def test_reference_matching(mock_refapi_init, caplog):
     ) == ("10.1021/acs.jpcc.8b11783", "crossref")
 
     assert RefAPI().match_reference("test/url") == ("test/url", "")
+    assert RefAPI.match_reference("10.10", quiet=True) == ("10.10", "")
     assert caplog.record_tuples == [
         ("API", 40, "test/url is not a valid doi or arXiv ID")
     ]
@@ -144,3 +146,55 @@ def test_render_default(mock_refapi_init, caplog):
     assert api_obj.render("md") == MD
     assert api_obj.render("rst") == RST
     assert api_obj.render("text") == TEXT
+
+
+def test_lean_mode():
+    """Test lean mode drops the response and keeps the parsed fields"""
+    with open(os.path.join(curpath, "crossref_test_example.xml"), "r") as f:
+        parser = CrossRefParser("10.1021/acs.jpcc.8b11783", text=f.read())
+
+    api = RefAPI("10.1021/acs.jpcc.8b11783", CONFIG, parser=parser, lean=True)
+    assert api.parser.text is None and api.parser.soup is None
+    assert api.render("text").startswith("Tirmzi2019jan Tirmzi, Ali Moeed.")
+    # plain strings do not keep the parsed tree alive
+    author = api.parser.parsed["author"]
+    assert all(type(name) is str for names in author for name in names)
+
+
+def test_template_fields():
+    """Test the fields used by the default templates"""
+    fields = template_fields(CONFIG, ["md", "rst", "text"])
+    assert {"title", "author", "pages", "has_print"} <= fields
+    assert not {"abstract", "title_html", "title_latex"} & fields
+    assert {"abstract", "title_latex"} <= template_fields(CONFIG, ["bibtex"])
+    assert template_fields({"a": "#if has_print\n#end if"}, ["a"]) >= {
+        "has_print"
+    }
+    assert template_fields({"a": "$getVar('title')"}, ["a"]) is None
+
+
+def test_selective_fields():
+    """Test the parser skips the fields that are not used"""
+    with open(os.path.join(curpath, "arXiv_test_example.xml"), "r") as f:
+        text = f.read()
+
+    fields = template_fields(CONFIG, ["md"])
+    parser = arXivParser("hep-th/9901001v3", text=text, fields=fields)
+    api = RefAPI("hep-th/9901001v3", CONFIG, parser=parser)
+    assert "abstract" not in parser.parsed
+    assert api.render("md").startswith("[^Imamura1999may]")
+
+    parser = arXivParser("hep-th/9901001v3", text=text)
+    assert parser.parsed["abstract"].startswith("We explicitly give")
+
+
+@patch("refparse.parser.requests.get")
+def test_doi_source(mock_get):
+    """Test the doi representation is selected per RefAPI"""
+    mock_get.return_value.ok = True
+    with open(os.path.join(curpath, "csl_test_example.json"), "r") as f:
+        mock_get.return_value.text = f.read()
+
+    api = RefAPI("10.1021/acs.jpcc.8b11783", CONFIG, doi_source="csl")
+    assert isinstance(api.parser, CrossRefCSLParser)
+    assert api.render("text").startswith("Tirmzi")
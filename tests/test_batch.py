@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.batch import RefBatch
+from refparse.api import RefAPI
+from unittest.mock import patch, Mock
+import json
+import os
+
+curpath = os.path.dirname(os.path.realpath(__file__))
+with open(os.path.join(curpath, "crossref_test_example.json"), "r") as f:
+    WORK = json.load(f)["message"]
+with open(os.path.join(curpath, "crossref_test_example.xml"), "r") as f:
+    DOI_XML = f.read()
+
+CONFIG = {"doc": "$author[0][0] $online_year"}
+
+
+@patch("refparse.parser.requests.get")
+def test_bulk_batch(mock_get):
+    """Test the DOIs are fetched in one request, missing ones one by one"""
+    works = Mock(ok=True)
+    works.json.return_value = {"message": {"items": [WORK]}}
+    single = Mock(ok=True, text=DOI_XML)
+    mock_get.side_effect = [works, single]
+
+    references = [
+        "https://doi.org/10.1021/ACS.JPCC.8B11783",
+        "10.1021/missing",
+        "not a reference",
+    ]
+    batch = RefBatch(references, CONFIG, bulk=True)
+
+    assert mock_get.call_args_list[0][1]["params"] == {
+        "filter": "doi:10.1021/acs.jpcc.8b11783,doi:10.1021/missing",
+        "rows": 2,
+    }
+    assert mock_get.call_count == 2
+    assert [api.status for api in batch.apis] == [True, True, False]
+    assert batch.render("doc") == ["Tirmzi 2019", "Tirmzi 2019", None]
+
+
+def test_render_all():
+    """Test rendering in a process pool keeps the order of the references"""
+    batch = RefBatch([], CONFIG)
+    for i in range(10):
+        parsed = {"author": [[f"Author{i}", ""]], "online_year": f"20{i:02d}"}
+        parser = Mock(ok=True, parsed=parsed)
+        batch.apis.append(RefAPI(f"10.1021/{i}", CONFIG, parser=parser))
+    batch.apis.append(RefAPI("not a reference", CONFIG))
+
+    results = batch.render_all(["doc"], processes=2, chunksize=3)
+    expected = [[("doc", f"Author{i} 20{i:02d}")] for i in range(10)]
+    assert results == expected + [[]]
+    assert batch.apis[3].output == {"doc": "Author3 2003"}
+
+
+@patch("refparse.parser.requests.get")
+def test_upgrade_preprints(mock_get):
+    """Test preprints with a doi are merged with the published record"""
+    with open(os.path.join(curpath, "arXiv_test_example.xml"), "r") as f:
+        arxiv = Mock(ok=True, status_code=200, text=f.read(), headers={})
+    published = Mock(ok=True, status_code=200, text=DOI_XML, headers={})
+
+    def get(url, **kwargs):
+        return published if "doi.org" in url else arxiv
+
+    mock_get.side_effect = get
+    references = ["arXiv:hep-th/9901001v3", "hep-th/9901001v2", "1807.01219"]
+    batch = RefBatch(references, CONFIG, upgrade=True)
+
+    # the preprints of the same doi share a single request
+    assert [url for (url,), _ in mock_get.call_args_list].count(
+        "http://dx.doi.org/10.1143/PTP.101.1155"
+    ) == 1
+    assert batch.render("doc") == ["Tirmzi 2019"] * 3
+    parsed = batch.apis[0].parser.parsed
+    assert parsed["arXiv ID"] == "hep-th/9901001v3"
+    assert parsed["doi"] == "10.1143/PTP.101.1155"
+    assert parsed["ref_type"] == "doi"
+    assert parsed["abstract"].startswith("We explicitly give")
+    assert batch.apis[1].parser.parsed["arXiv ID"] == "hep-th/9901001v2"
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.breaker import (
+    CircuitBreaker,
+    get_breaker,
+    guarded_get,
+    OPEN,
+    HALF_OPEN,
+)
+from refparse.scheduler import LookupScheduler, SCHEDULERS, INTERACTIVE
+from refparse.metrics import METRICS, format_metrics
+from refparse.store import RecordStore
+from refparse.parser import CrossRefParser
+from refparse.api import RefAPI
+from unittest.mock import patch, Mock
+import threading
+import requests
+import os
+
+curpath = os.path.dirname(os.path.realpath(__file__))
+with open(os.path.join(curpath, "crossref_test_example.xml"), "r") as f:
+    DOI_XML = f.read()
+
+CONFIG = {"doc": "$author[0][0] $online_year"}
+
+
+def test_breaker_states():
+    """Test the breaker opens, probes once when half-open and closes"""
+    breaker = CircuitBreaker("upstream", failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    # the reset timeout passed, a single probe is let through
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+@patch("refparse.breaker.requests.get")
+def test_open_breaker_skips_slot(mock_get):
+    """Test a request to an open upstream does not wait for a slot"""
+    url = "https://upstream/works"
+    breaker = get_breaker(url)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    scheduler = SCHEDULERS["upstream"] = LookupScheduler("upstream", 1)
+    scheduler.acquire(INTERACTIVE)
+    responses = []
+    thread = threading.Thread(
+        target=lambda: responses.append(guarded_get(url))
+    )
+    thread.start()
+    thread.join(5)
+    scheduler.release(INTERACTIVE)
+    assert not thread.is_alive()
+    assert responses == [None]
+    assert not mock_get.called
+
+
+@patch("refparse.parser.requests.get")
+def test_parser_fails_fast(mock_get):
+    """Test requests fail fast once the upstream breaker is open"""
+    mock_get.side_effect = requests.Timeout("timed out")
+    for _ in range(CircuitBreaker.FAILURE_THRESHOLD + 3):
+        parser = CrossRefParser("10.1021/acs.jpcc.8b11783")
+        assert not parser.ok
+
+    assert mock_get.call_count == CircuitBreaker.FAILURE_THRESHOLD
+    assert get_breaker(parser.query_url).state == OPEN
+    metrics = format_metrics(METRICS.snapshot())
+    assert "breaker.dx.doi.org.state open" in metrics
+    assert "breaker.dx.doi.org.rejected 3" in metrics
+    assert "requests.dx.doi.org 5" in metrics
+
+
+@patch("refparse.parser.requests.get")
+def test_open_breaker_serves_stored(mock_get, tmp_path):
+    """Test stale stored records are served while the breaker is open"""
+    mock_get.return_value = Mock(ok=True, status_code=200, text=DOI_XML)
+    mock_get.return_value.headers = {}
+    store = RecordStore(str(tmp_path / "records.sqlite"))
+    RefAPI("10.1021/acs.jpcc.8b11783", CONFIG, store=store)
+
+    breaker = get_breaker(CrossRefParser.QUERY_URL)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    api = RefAPI("10.1021/acs.jpcc.8b11783", CONFIG, store=store, max_age=0)
+    assert api.render("doc") == "Tirmzi 2019"
+    assert mock_get.call_count == 1
+    assert METRICS.snapshot()["counters"]["store.stale_served"] == 1
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.refparse import cli
+from refparse.render_cache import RenderCache
+from refparse.store import RecordStore
+from click.testing import CliRunner
+from unittest.mock import patch, Mock
+import logging
+import pytest
+import json
+import os
+
+curpath = os.path.dirname(os.path.realpath(__file__))
+with open(os.path.join(curpath, "crossref_test_example.xml"), "r") as f:
+    DOI_XML = f.read()
+
+DOI = "10.1021/acs.jpcc.8b11783"
+
+
+@pytest.fixture
+def run(tmp_path):
+    """Invoke the CLI with the store and caches in tmp_path, no daemon"""
+    store = RecordStore(str(tmp_path / "records.sqlite"))
+    render_cache = RenderCache(str(tmp_path / "render.sqlite"))
+    response = Mock(ok=True, status_code=200, text=DOI_XML, headers={})
+    # the cli sets the level of the root logger
+    level = logging.getLogger().level
+    with patch("refparse.refparse.open_store", return_value=store), patch(
+        "refparse.refparse.open_render_cache", return_value=render_cache
+    ), patch("refparse.refparse.start_queue_logging"), patch(
+        "refparse.refparse.send_request", return_value=None
+    ), patch(
+        "refparse.breaker.requests.get", return_value=response
+    ) as mock_get:
+
+        def invoke(*args):
+            result = CliRunner().invoke(cli, [str(arg) for arg in args])
+            assert result.exit_code == 0, result.output
+            return result
+
+        invoke.mock_get = mock_get
+        invoke.store = store
+        yield invoke
+    logging.getLogger().setLevel(level)
+
+
+def test_parse(run, tmp_path):
+    """Test parse renders to the output and to the output files"""
+    result = run("parse", DOI, "-f", "md")
+    assert "Tirmzi" in result.output
+    output = tmp_path / "refs.md"
+    run("parse", DOI, "-o", f"md={output}", "--metrics")
+    assert output.read_text().startswith("[^Tirmzi2019")
+
+
+def test_parse_journal(run, tmp_path):
+    """Test a resumed batch does not request the finished references"""
+    journal = tmp_path / "job.jsonl"
+    options = ["-f", "md", "--no-store", "--journal", journal]
+    run("parse", DOI, *options)
+    result = run("parse", DOI, *options, "--resume")
+    assert "Tirmzi" in result.output
+    assert run.mock_get.call_count == 1
+
+
+def test_daemon(run):
+    """Test the daemon options without a running daemon"""
+    run("daemon", "--stop")
+    run("daemon", "--metrics")
+    with patch("refparse.refparse.serve_daemon") as mock_serve:
+        run("daemon")
+    assert mock_serve.called
+
+
+def test_formats_and_config(run, tmp_path):
+    """Test show-formats, gui and config"""
+    assert "bibtex" in run("show-formats").output
+    with patch("refparse.gui.refparse_gui") as mock_gui:
+        run("gui")
+    assert mock_gui.called
+    path = str(tmp_path / "user_config.yaml")
+    with patch("refparse.refparse.USR_PATH", path), patch(
+        "refparse.refparse.USR_DIR", str(tmp_path)
+    ), patch("refparse.refparse.click.edit") as mock_edit:
+        run("config", "nano")
+    assert mock_edit.call_args[1]["filename"] == path
+    assert os.path.isfile(path)
+
+
+def test_store_commands(run, tmp_path):
+    """Test search, refresh, export-pack, import-pack and ingest"""
+    run("parse", DOI, "-f", "md")
+    assert "Tirmzi" in run("search", "perovskite OR tip", "-f", "md").output
+    run("refresh", "--max-age", 0)
+
+    pack = tmp_path / "records.zip"
+    run("export-pack", pack)
+    run("import-pack", pack)
+    assert run.store.entry(DOI, "crossref") is not None
+
+    run("ingest", "--index", tmp_path / "index.sqlite")
+
+
+def test_watch_and_crawl(run, tmp_path):
+    """Test watch --once and crawl"""
+    (tmp_path / "main.tex").write_text(f"see doi {DOI}\n")
+    run("watch", tmp_path, "-f", "md", "--once")
+    assert "Tirmzi" in (tmp_path / "references.bib").read_text()
+
+    result = run("crawl", DOI, "--depth", 0)
+    events = [json.loads(line) for line in result.output.splitlines()]
+    assert events[0]["type"] == "record"
+    assert events[0]["doi"] == DOI
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.crawl import Crawler, CitationParser, RateLimiter
+from unittest.mock import patch
+import time
+import os
+
+curpath = os.path.dirname(os.path.realpath(__file__))
+with open(os.path.join(curpath, "crossref_test_example.xml"), "r") as f:
+    DOI_XML = f.read()
+
+
+def test_citation_parser():
+    """Test the cited DOIs are parsed from the citation list"""
+    parser = CitationParser("10.1021/acs.jpcc.8b11783", text=DOI_XML)
+    citations = parser.parsed["citations"]
+    assert citations[0] == "10.1063/1.4864778"
+    assert len(citations) == len(set(citations)) > 10
+    assert parser.parsed["author"][0] == ["Tirmzi", "Ali Moeed"]
+
+
+@patch("refparse.parser.requests.get")
+def test_crawl(mock_get):
+    """Test the crawl is breadth-first, bounded and deduplicated"""
+    mock_get.return_value.ok = True
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.text = DOI_XML
+    citations = CitationParser("10.1/seed", text=DOI_XML).parsed["citations"]
+
+    crawler = Crawler(depth=1, workers=2, rate=None, max_records=3)
+    events = list(crawler.crawl(["10.1/seed", "10.1/SEED"]))
+
+    records = [event for event in events if event["type"] == "record"]
+    assert [(r["doi"], r["depth"]) for r in records[:1]] == [("10.1/seed", 0)]
+    assert sorted(r["doi"] for r in records[1:]) == sorted(citations[:2])
+    assert all(r["depth"] == 1 for r in records[1:])
+    assert "citations" not in records[0]["record"]
+    assert mock_get.call_count == 3
+
+    edges = [event for event in events if event["type"] == "edge"]
+    assert len(edges) == 3 * len(citations)
+    assert edges[0] == {
+        "type": "edge",
+        "source": "10.1/seed",
+        "target": citations[0],
+    }
+
+
+def test_rate_limiter():
+    """Test the calls are spaced by the rate"""
+    limiter = RateLimiter(50)
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.wait()
+    assert time.monotonic() - start >= 0.06
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.daemon import RefDaemon, send_request
+from unittest.mock import patch
+import threading
+import logging
+import os
+
+curpath = os.path.dirname(os.path.realpath(__file__))
+with open(os.path.join(curpath, "crossref_test_example.xml"), "r") as f:
+    DOI_XML = f.read()
+
+CONFIG = {"doc": "$author[0][0] $online_year"}
+
+
+def test_send_request_without_daemon(tmp_path):
+    """Test the client returns None if there is no daemon"""
+    assert send_request({"op": "ping"}, str(tmp_path / "none.sock")) is None
+
+
+@patch("refparse.parser.requests.get")
+def test_daemon_parse(mock_get, tmp_path, caplog):
+    """Test the daemon resolves once and serves cached references"""
+    mock_get.return_value.ok = True
+    mock_get.return_value.text = DOI_XML
+    caplog.set_level(logging.INFO)
+    path = str(tmp_path / "refparse.sock")
+
+    server = RefDaemon(path, lambda: CONFIG)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        request = {
+            "op": "parse",
+            "reference": "10.1021/acs.jpcc.8b11783",
+            "formats": ["doc"],
+        }
+        response = send_request(request, path)
+        assert response["status"]
+        assert response["results"] == [["doc", "Tirmzi 2019"]]
+        assert "[INFO] CrossRefParser - doi found" in response["log"]
+
+        assert send_request(request, path)["results"] == response["results"]
+        assert mock_get.call_count == 1
+
+        response = send_request({"op": "parse", "reference": "x"}, path)
+        assert not response["status"]
+        assert response["log"] == [
+            "[ERROR] API - x is not a valid doi or arXiv ID"
+        ]
+        assert send_request({"op": "ping"}, path)["cached"] == 1
+    finally:
+        send_request({"op": "shutdown"}, path)
+        thread.join()
+        server.server_close()
+    assert not os.path.exists(path)
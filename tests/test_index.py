@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.index import OfflineIndex
+from refparse.api import RefAPI
+from unittest.mock import patch
+import logging
+import gzip
+import json
+import os
+import re
+
+curpath = os.path.dirname(os.path.realpath(__file__))
+with open(os.path.join(curpath, "crossref_test_example.json"), "r") as f:
+    WORK = json.load(f)["message"]
+
+OAI_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+<ListRecords>
+<record>
+<header><identifier>oai:arXiv.org:hep-th/9901001</identifier></header>
+<metadata>
+<arXiv xmlns="http://arxiv.org/OAI/arXiv/">
+<id>hep-th/9901001</id>
+<created>1999-01-04</created>
+<updated>1999-05-10</updated>
+<doi>10.1143/PTP.101.1155</doi>
+<authors><author><keyname>Imamura</keyname>
+<forenames>Yosuke</forenames></author></authors>
+<title>String Junctions and Their Duals in
+  Heterotic String Theory</title>
+<abstract>  We explicitly give the correspondence.
+</abstract>
+</arXiv>
+</metadata>
+</record>
+<record>
+<header status="deleted"><identifier>oai:arXiv.org:0704.0002</identifier>
+</header>
+</record>
+</ListRecords>
+</OAI-PMH>
+"""
+
+CONFIG = {"doc": "$author[0][0] $online_year $title"}
+
+
+def test_ingest_and_lookup(tmp_path):
+    """Test ingesting crossref and arXiv dumps into the index"""
+    crossref_dir = tmp_path / "crossref"
+    crossref_dir.mkdir()
+    with gzip.open(crossref_dir / "0.json.gz", "wt") as f:
+        json.dump({"items": [WORK, {"title": ["no doi"]}]}, f)
+    arxiv_path = tmp_path / "arxiv.xml"
+    arxiv_path.write_text(OAI_XML)
+
+    index = OfflineIndex(str(tmp_path / "index.sqlite"))
+    assert index.ingest_crossref([str(crossref_dir)]) == 1
+    assert index.ingest_arxiv([str(arxiv_path)]) == 1
+    assert len(index) == 2
+
+    record = index.lookup("10.1021/ACS.JPCC.8B11783", "crossref")
+    assert record["journal_abbrev_title"] == "J. Phys. Chem. C"
+    assert "doi" not in record and "url" not in record
+
+    assert index.lookup("hep-th/9901001v3", "arXiv") == {
+        "has_publication": False,
+        "has_print": False,
+        "published_doi": "10.1143/PTP.101.1155",
+        "abstract": "We explicitly give the correspondence.",
+        "title": "String Junctions and Their Duals in Heterotic String Theory",
+        "title_latex": (
+            "String Junctions and Their Duals in Heterotic String Theory"
+        ),
+        "online_year": "1999",
+        "online_month": "5",
+        "online_day": "10",
+        "author": [["Imamura", "Yosuke"]],
+    }
+    assert index.lookup("0704.0002", "arXiv") is None
+
+
+@patch("refparse.parser.requests.get")
+def test_offline_api(mock_get, tmp_path, caplog):
+    """Test RefAPI resolves from the index without requests"""
+    index = OfflineIndex(str(tmp_path / "index.sqlite"))
+    index.insert([("hep-th/9901001", "arXiv", {"author": [["Imamura", ""]]})])
+
+    api = RefAPI("arXiv:hep-th/9901001v3", CONFIG, sources=[index])
+    assert api.status
+    assert api.parser.parsed["arXiv ID"] == "hep-th/9901001v3"
+    assert api.render("doc") == "Imamura  "
+
+    api = RefAPI("10.1021/missing", CONFIG, sources=[index], offline=True)
+    assert not api.status
+    assert not mock_get.called
+    assert caplog.record_tuples == [
+        ("API", logging.ERROR, "10.1021/missing is not found offline")
+    ]
+
+
+def test_ingest_skips_malformed(tmp_path):
+    """Test malformed records are counted and skipped, the ingest goes on"""
+    works = tmp_path / "works.jsonl.gz"
+    with gzip.open(works, "wt") as f:
+        f.write(json.dumps({"DOI": "10.1000/a", "author": "not a list"}))
+        f.write("\n{not json\n")
+        f.write(json.dumps(WORK) + "\n")
+    arxiv_path = tmp_path / "arxiv.xml"
+    # a record without dates
+    oai_xml = re.sub(r"<(created|updated)>.*</\1>", "", OAI_XML)
+    arxiv_path.write_text(oai_xml)
+
+    index = OfflineIndex(str(tmp_path / "index.sqlite"))
+    assert index.ingest_crossref([str(works)]) == 1
+    assert index.ingest_arxiv([str(arxiv_path)]) == 0
+    assert index.skipped == 3
+    assert index.lookup("10.1021/acs.jpcc.8b11783", "crossref") is not None
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.jobs import JobJournal
+from refparse.batch import RefBatch
+from unittest.mock import patch, Mock
+import pytest
+import os
+
+curpath = os.path.dirname(os.path.realpath(__file__))
+with open(os.path.join(curpath, "crossref_test_example.xml"), "r") as f:
+    DOI_XML = f.read()
+
+CONFIG = {"doc": "$doi $online_year"}
+REFERENCES = ["10.1021/first", "10.1021/second", "10.1021/third"]
+
+
+def test_journal_resume(tmp_path):
+    """Test failed and cut entries are not finished, other batches fail"""
+    path = str(tmp_path / "job.jsonl")
+    with JobJournal(path, REFERENCES) as journal:
+        journal.record(0, REFERENCES[0], "crossref", {"title": "First"})
+        journal.record(1, REFERENCES[1], "crossref", None)
+    with open(path, "a") as f:
+        f.write('{"index": 2, "reference"')
+
+    with JobJournal(path, REFERENCES, resume=True) as journal:
+        assert list(journal.done) == [0]
+        assert journal.done[0]["record"] == {"title": "First"}
+        journal.record(1, REFERENCES[1], "crossref", {"title": "Second"})
+    with open(path) as f:
+        assert f.read().endswith('"record": {"title": "Second"}}\n')
+
+    assert list(JobJournal(path, REFERENCES, resume=True).done) == [0, 1]
+    assert not JobJournal(path, REFERENCES).done
+    with pytest.raises(ValueError):
+        JobJournal(path, REFERENCES[:2], resume=True)
+
+
+@patch("refparse.parser.requests.get")
+def test_batch_resume(mock_get, tmp_path):
+    """Test a resumed batch only requests the failed references"""
+    path = str(tmp_path / "job.jsonl")
+    found = Mock(ok=True, status_code=200, text=DOI_XML, headers={})
+    failed = Mock(ok=False, status_code=404, headers={})
+    mock_get.side_effect = [found, failed, found]
+    with JobJournal(path, REFERENCES) as journal:
+        batch = RefBatch(REFERENCES, CONFIG, journal=journal)
+    assert [api.status for api in batch.apis] == [True, False, True]
+
+    mock_get.side_effect = [found]
+    with JobJournal(path, REFERENCES, resume=True) as journal:
+        batch = RefBatch(REFERENCES, CONFIG, journal=journal)
+    assert mock_get.call_args[0][0].endswith("10.1021/second")
+    assert mock_get.call_count == 4
+    assert batch.render("doc") == [
+        f"{reference} 2019" for reference in REFERENCES
+    ]
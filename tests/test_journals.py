@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.journals import JournalIndex, build_index, normalize, abbreviate
+from refparse.parser import CrossRefJSONParser
+import json
+import os
+
+curpath = os.path.dirname(os.path.realpath(__file__))
+with open(os.path.join(curpath, "crossref_test_example.json"), "r") as f:
+    WORK = json.load(f)["message"]
+
+
+def test_normalize():
+    """Test case, punctuation, accents, & and a leading the are ignored"""
+    assert normalize("The Journal of Physical Chemistry C") == (
+        "journal of physical chemistry c"
+    )
+    assert normalize("Energy &amp; Environmental Science") == normalize(
+        "energy and environmental science"
+    )
+    assert normalize("Annalen der Physík") == "annalen der physik"
+
+
+def test_index(tmp_path):
+    """Test exact and prefix lookups of a built index"""
+    path = str(tmp_path / "journals.tsv")
+    entries = [
+        ("Physical Review Letters", "Phys. Rev. Lett."),
+        ("Physical Review B", "Phys. Rev. B"),
+        ("Nature", "Nature"),
+        ("Nature Physics", "Nat. Phys."),
+        ("Advanced Materials", "Adv. Mater."),
+    ]
+    assert build_index(entries, path) == 5
+
+    index = JournalIndex(path)
+    assert len(index) == 5
+    for title, abbrev in entries:
+        assert index.lookup(title) == abbrev
+    assert index.lookup("physical review") is None
+    assert index.lookup("Zeitschrift") is None
+    assert index.lookup("") is None
+    assert index.prefix("Physical Review") == [
+        ("physical review b", "Phys. Rev. B"),
+        ("physical review letters", "Phys. Rev. Lett."),
+    ]
+    assert [title for title, _ in index.prefix("nat")] == [
+        "nature",
+        "nature physics",
+    ]
+
+
+def test_bundled_abbreviation():
+    """Test missing abbreviations are filled from the bundled index"""
+    assert abbreviate("Physical Review Letters") == "Phys. Rev. Lett."
+    assert abbreviate("Unknown Journal of Nothing") == ""
+
+    work = dict(WORK, **{"short-container-title": []})
+    parsed = CrossRefJSONParser("10.1021/acs.jpcc.8b11783", text=work).parsed
+    assert parsed["journal_abbrev_title"] == "J. Phys. Chem. C"
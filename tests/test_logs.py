@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.logs import (
+    SummaryFilter,
+    summarized_logs,
+    start_queue_logging,
+    stop_queue_logging,
+    flush_logs,
+)
+import threading
+import logging
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.name, threading.current_thread()))
+
+
+def test_summary_filter():
+    """Test repeated messages are counted, the first warnings passed"""
+    log_filter = SummaryFilter(limit=2)
+    logger = logging.getLogger("CrossRefParser")
+
+    def record(level, msg):
+        return logger.makeRecord(logger.name, level, "", 0, msg, (), None)
+
+    passed = [
+        log_filter.filter(record(logging.INFO, "doi found")) for _ in range(5)
+    ]
+    passed += [
+        log_filter.filter(record(logging.ERROR, "Incorrect doi"))
+        for _ in range(3)
+    ]
+    assert passed == [False] * 5 + [True, True, False]
+    assert log_filter.summary() == [
+        "5x [INFO] CrossRefParser - doi found",
+        "1x [ERROR] CrossRefParser - Incorrect doi",
+    ]
+    assert log_filter.summary(lines=1)[1] == "1 other messages"
+
+
+def test_queue_logging():
+    """Test the root handlers write from the listener thread"""
+    root = logging.getLogger()
+    handler = ListHandler()
+    handlers = root.handlers[:]
+    for existing in handlers:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    level = root.level
+    root.setLevel(logging.INFO)
+    try:
+        start_queue_logging()
+        assert handler not in root.handlers
+        with summarized_logs():
+            for _ in range(3):
+                logging.getLogger("API").info("found in store")
+        flush_logs()
+        names = [name for name, _ in handler.records]
+        assert names == ["Log", "Log"]
+        assert all(
+            thread is not threading.current_thread()
+            for _, thread in handler.records
+        )
+    finally:
+        stop_queue_logging()
+        assert root.handlers == [handler]
+        root.removeHandler(handler)
+        for existing in handlers:
+            root.addHandler(existing)
+        root.setLevel(level)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.pack import CachePack, export_pack
+from refparse.store import RecordStore
+from refparse.api import RefAPI
+from unittest.mock import patch
+import zipfile
+import pytest
+import json
+
+CONFIG = {"doc": "$author[0][0] $online_year"}
+RECORD = {"author": [["Tirmzi", "Ali Moeed"]], "online_year": "2019"}
+
+
+def test_export_import(tmp_path):
+    """Test records are exported to a pack and imported into a store"""
+    store = RecordStore(str(tmp_path / "records.sqlite"))
+    store.save("10.1021/ACS.JPCC.8B11783", "crossref", RECORD)
+    store.save("1807.01219v2", "arXiv", {"title": "String junctions"})
+    path = str(tmp_path / "records.pack")
+
+    assert export_pack(store, path) == 2
+    assert export_pack(store, path, ["doi:10.1021/acs.jpcc.8b11783"]) == 1
+    with zipfile.ZipFile(path) as archive:
+        assert json.loads(archive.read("manifest.json"))["count"] == 1
+
+    export_pack(store, path)
+    pack = CachePack(path)
+    assert len(pack) == 2
+    assert pack.lookup("10.1021/acs.jpcc.8b11783", "crossref") == RECORD
+    assert pack.lookup("1807.01219", "arXiv") == {"title": "String junctions"}
+    assert pack.lookup("10.1/missing", "crossref") is None
+
+    other = RecordStore(str(tmp_path / "other.sqlite"))
+    assert pack.import_into(other) == 2
+    assert other.lookup("10.1021/acs.jpcc.8b11783", "crossref") == RECORD
+
+
+@patch("refparse.parser.requests.get")
+def test_mounted_pack(mock_get, tmp_path):
+    """Test RefAPI resolves offline from a mounted pack"""
+    store = RecordStore(str(tmp_path / "records.sqlite"))
+    store.save("10.1021/acs.jpcc.8b11783", "crossref", RECORD)
+    path = str(tmp_path / "records.pack")
+    export_pack(store, path)
+
+    pack = CachePack(path)
+    api = RefAPI("10.1021/acs.jpcc.8b11783", CONFIG, sources=[pack])
+    assert api.render("doc") == "Tirmzi 2019"
+    assert not mock_get.called
+
+
+def test_pack_version(tmp_path):
+    """Test packs of other versions and other files are rejected"""
+    path = str(tmp_path / "records.pack")
+    with zipfile.ZipFile(path, "w") as archive:
+        manifest = {"format": "refparse-pack", "version": 99, "count": 0}
+        archive.writestr("manifest.json", json.dumps(manifest))
+    with pytest.raises(ValueError, match="pack version 99"):
+        CachePack(path)
+
+    (tmp_path / "other.txt").write_text("text")
+    with pytest.raises(ValueError, match="is not a refparse pack"):
+        CachePack(str(tmp_path / "other.txt"))
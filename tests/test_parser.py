@@ -1,9 +1,16 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from unittest.mock import patch
-from refparse.parser import CrossRefParser, arXivParser, ParserBase
+from unittest.mock import patch, Mock
+from refparse.parser import (
+    CrossRefParser,
+    CrossRefJSONParser,
+    CrossRefCSLParser,
+    arXivParser,
+    ParserBase,
+)
 import os
+import json
 import logging
 
 curpath = os.path.dirname(os.path.realpath(__file__))
@@ -11,6 +18,10 @@ with open(os.path.join(curpath, "arXiv_test_example.xml"), "r") as f:
     ARXIV_XML = f.read()
 with open(os.path.join(curpath, "crossref_test_example.xml"), "r") as f:
     DOI_XML = f.read()
+with open(os.path.join(curpath, "crossref_test_example.json"), "r") as f:
+    DOI_JSON = f.read()
+with open(os.path.join(curpath, "csl_test_example.json"), "r") as f:
+    DOI_CSL = f.read()
 
 
 class TestParser(ParserBase):
@@ -63,6 +74,7 @@ def test_arXiv_parser(mock_get, caplog):
         "url": "http://arxiv.org/hep-th/9901001v3",
         "has_publication": False,
         "has_print": False,
+        "published_doi": "10.1143/PTP.101.1155",
         "abstract": "We explicitly give the correspondence between spectra of "
         "heterotic string theory compactified on $T^2$ and string "
         "junctions in type IIB theory compactified on $S^2$.",
@@ -134,3 +146,122 @@ def test_crossref_parser(mock_get, caplog):
     }
 
     assert parser.parsed == api_dict
+
+
+@patch("refparse.parser.requests.get")
+def test_crossref_json_parser(mock_get):
+    """Test CrossRefJSONParser with the REST work of the same doi"""
+    mock_get.return_value.ok = True
+    mock_get.return_value.text = DOI_JSON
+
+    parser = CrossRefJSONParser("10.1021/acs.jpcc.8b11783")
+    xml_parser = CrossRefParser("10.1021/acs.jpcc.8b11783", text=DOI_XML)
+
+    # the unixsd parser uses the online date for the print date
+    print_date = {"print_year": "2019", "print_month": "02", "print_day": "14"}
+    assert parser.parsed == {**xml_parser.parsed, **print_date}
+
+    work = json.loads(DOI_JSON)["message"]
+    work["title"] = ["CH<sub>3</sub>NH<sub>3</sub>PbI<sub>3</sub> films"]
+    del work["published-print"]
+    parsed = CrossRefJSONParser("10.1021/acs.jpcc.8b11783", text=work).parsed
+    assert parsed["title"] == "CH3NH3PbI3 films"
+    assert parsed["title_latex"] == (
+        "CH\\textsubscript{3}NH\\textsubscript{3}PbI\\textsubscript{3} films"
+    )
+    assert not parsed["has_print"]
+    assert "pages" not in parsed
+
+
+def test_crossref_json_print_only():
+    """Test works without an online date, e.g. print-only works"""
+    work = {"DOI": "10.1000/x", "published-print": {"date-parts": [[2010, 7]]}}
+    parsed = CrossRefJSONParser("10.1000/x", text=work).parsed
+    assert [parsed["online_year"], parsed["online_month"]] == ["", ""]
+    assert [parsed["print_year"], parsed["print_month"]] == ["2010", "07"]
+    assert parsed["has_print"]
+
+    item = {"title": "Print", "published-print": work["published-print"]}
+    parsed = CrossRefCSLParser("10.1000/x", text=item).parsed
+    assert parsed["online_year"] == ""
+    assert parsed["print_year"] == "2010"
+
+    # crossref also has null date parts
+    work = {"DOI": "10.1000/x", "published-online": {"date-parts": [[None]]}}
+    parsed = CrossRefJSONParser("10.1000/x", text=work).parsed
+    assert parsed["online_year"] == ""
+
+
+@patch("refparse.parser.requests.get")
+def test_crossref_stream(mock_get):
+    """Test the streamed response is parsed up to the citation list"""
+    content = DOI_XML.encode("utf-8")
+    chunks = [content[i : i + 1024] for i in range(0, len(content), 1024)]
+    consumed = []
+
+    def iter_content(chunk_size):
+        for chunk in chunks:
+            consumed.append(chunk)
+            yield chunk
+
+    mock_get.return_value = Mock(ok=True, status_code=200, headers={})
+    mock_get.return_value.iter_content = iter_content
+
+    parser = CrossRefParser("10.1021/acs.jpcc.8b11783", stream=True)
+    xml_parser = CrossRefParser("10.1021/acs.jpcc.8b11783", text=DOI_XML)
+    assert parser.parsed == xml_parser.parsed
+    assert mock_get.call_args[1]["stream"]
+    assert len(consumed) < len(chunks) / 2
+    assert mock_get.return_value.close.called
+
+
+@patch("refparse.parser.requests.get")
+def test_crossref_stream_tree(mock_get):
+    """Test the streamed tree is parsed without a soup"""
+    title = "Perovskite Alloy"
+    text = DOI_XML.replace(
+        title, "Perovskite <i>in situ</i> Alloy of CH<sub>3</sub>", 1
+    )
+    mock_get.return_value = Mock(ok=True, status_code=200, headers={})
+    mock_get.return_value.iter_content = lambda size: [text.encode("utf-8")]
+
+    with patch("refparse.parser.BeautifulSoup") as mock_soup:
+        parser = CrossRefParser("10.1021/acs.jpcc.8b11783", stream=True)
+    assert not mock_soup.called
+    xml_parser = CrossRefParser("10.1021/acs.jpcc.8b11783", text=text)
+    assert parser.parsed == xml_parser.parsed
+    assert parser.parsed["title_html"].endswith(
+        "Perovskite <i>in situ</i> Alloy of CH<sub>3</sub>"
+    )
+    assert parser.parsed["pages"] and parser.parsed["has_print"]
+
+
+@patch("refparse.parser.requests.get")
+def test_crossref_csl_parser(mock_get):
+    """Test CrossRefCSLParser negotiates CSL-JSON with the same fields"""
+    mock_get.return_value.ok = True
+    mock_get.return_value.text = DOI_CSL
+
+    parser = CrossRefCSLParser("10.1021/acs.jpcc.8b11783")
+    json_parser = CrossRefJSONParser("10.1021/acs.jpcc.8b11783", text=DOI_JSON)
+    assert parser.parsed == json_parser.parsed
+    assert mock_get.call_args[0][0] == (
+        "https://doi.org/10.1021/acs.jpcc.8b11783"
+    )
+    assert mock_get.call_args[1]["headers"] == {
+        "Accept": "application/vnd.citationstyles.csl+json"
+    }
+
+    # DataCite items only have the issued date
+    item = {
+        "title": "A dataset",
+        "author": [{"family": "Doe", "given": "Jane"}],
+        "container-title": "Zenodo",
+        "issued": {"date-parts": [[2020, 3]]},
+    }
+    parsed = CrossRefCSLParser("10.5281/zenodo.1", text=item).parsed
+    assert parsed["author"] == [["Doe", "Jane"]]
+    assert parsed["journal_full_title"] == "Zenodo"
+    assert parsed["online_year"] == "2020"
+    assert parsed["online_month"] == "03"
+    assert not parsed["has_print"]
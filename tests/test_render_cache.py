@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.render_cache import RenderCache
+from refparse.parser import CrossRefParser
+from refparse.batch import RefBatch
+from refparse.api import RefAPI
+from unittest.mock import patch
+
+RECORD = {"author": [["Tirmzi", "Ali Moeed"]], "online_year": "2019"}
+CONFIG = {"doc": "$author[0][0] $online_year", "year": "$online_year"}
+
+
+def cached_api(reference, config, cache):
+    parser = CrossRefParser(reference, record=RECORD)
+    return RefAPI(reference, config, parser=parser, render_cache=cache)
+
+
+def test_render_cache(tmp_path):
+    """Test outputs are reused until the record or the template changes"""
+    cache = RenderCache(str(tmp_path / "render.sqlite"))
+    api = cached_api("10.1000/a", CONFIG, cache)
+    assert api.render("doc") == "Tirmzi 2019"
+    assert api.render("year") == "2019"
+    assert len(cache) == 2
+
+    with patch("refparse.api.render_template") as mock_render:
+        api = cached_api("10.1000/a", CONFIG, cache)
+        assert api.render("doc") == "Tirmzi 2019"
+        assert not mock_render.called
+
+    # only the edited format is rendered again
+    config = {**CONFIG, "year": "($online_year)"}
+    with patch(
+        "refparse.api.render_template", return_value="(2019)"
+    ) as mock_render:
+        api = cached_api("10.1000/a", config, cache)
+        assert api.render("doc") == "Tirmzi 2019"
+        assert api.render("year") == "(2019)"
+        assert mock_render.call_count == 1
+
+    # the reference is part of the record
+    assert cached_api("10.1000/b", CONFIG, cache).record_key != api.record_key
+
+
+def test_batch_render_cache(tmp_path):
+    """Test only records with missed formats are rendered in the pool"""
+    cache = RenderCache(str(tmp_path / "render.sqlite"))
+    cached_api("10.1000/a", CONFIG, cache).render("doc")
+
+    with patch(
+        "refparse.api.RefAPI.resolve",
+        side_effect=lambda ref, *args: CrossRefParser(ref, record=RECORD),
+    ), patch("refparse.batch.render_parallel") as mock_parallel:
+        mock_parallel.return_value = [["Tirmzi 2019", "2019"]]
+        batch = RefBatch(
+            ["10.1000/a", "10.1000/b"], CONFIG, render_cache=cache, lean=False
+        )
+        results = batch.render_all(["doc"], processes=2)
+
+    assert [list(record) for record in mock_parallel.call_args[0][0]] == [
+        list(batch.apis[1].parser.parsed)
+    ]
+    assert results == [[("doc", "Tirmzi 2019")], [("doc", "Tirmzi 2019")]]
+
+
+def test_render_cache_salt(tmp_path):
+    """Test an upgraded renderer or another backend misses the cache"""
+    cache = RenderCache(str(tmp_path / "render.sqlite"))
+    cache.put("record", "$title", "Title")
+    assert cache.get("record", "$title") == "Title"
+
+    with patch("refparse.templates.FAST_TEMPLATES", False):
+        assert cache.get("record", "$title") is None
+    with patch(
+        "refparse.render_cache._renderer_version", return_value="upgraded"
+    ):
+        assert cache.get("record", "$title") is None
+        cache.put("record", "$title", "Upgraded")
+    assert cache.get("record", "$title") == "Title"
+
+
+def test_render_cache_prune(tmp_path):
+    """Test the oldest outputs beyond the maximum are pruned"""
+    path = str(tmp_path / "render.sqlite")
+    cache = RenderCache(path, max_entries=2)
+    with patch("refparse.render_cache.time.time", side_effect=[1, 2, 3]):
+        for record in "abc":
+            cache.put(record, "$title", record.upper())
+    assert len(cache) == 3
+    cache.prune()
+    assert len(cache) == 2
+    assert cache.get("a", "$title") is None
+    assert cache.get("c", "$title") == "C"
+    cache.close()
+    assert len(RenderCache(path, max_entries=1)) == 1
+
+
+def test_forwarded_parse_skips_render_cache():
+    """Test a parse forwarded to the daemon does not open the cache"""
+    from refparse.refparse import parse_reference
+
+    response = {"status": True, "results": [["doc", "Tirmzi"]], "log": []}
+    with patch(
+        "refparse.refparse.send_request", return_value=response
+    ), patch("refparse.refparse.open_render_cache") as mock_cache:
+        parse_reference("10.1/a", ["doc"], True, render_cache=True)
+    assert not mock_cache.called
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.scheduler import (
+    LookupScheduler,
+    SCHEDULERS,
+    lookup_priority,
+    current_priority,
+    share_schedulers,
+    upstream_slot,
+    INTERACTIVE,
+    BULK,
+)
+from refparse.daemon import RefDaemon, send_request
+from refparse.metrics import METRICS
+from refparse.parser import CrossRefParser
+from unittest.mock import patch, Mock
+import subprocess
+import threading
+import time
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# a batch process that shares the schedulers of the daemon
+BATCH = """
+import sys
+from refparse.scheduler import share_schedulers, upstream_slot
+from refparse.scheduler import lookup_priority, BULK
+
+share_schedulers(sys.argv[1])
+with lookup_priority(BULK), upstream_slot("https://upstream/works"):
+    print("granted", flush=True)
+"""
+
+
+def wait_queued(scheduler, priority, count):
+    name = f"scheduler.{scheduler.name}.{priority}.queued"
+    while METRICS.snapshot()["gauges"].get(name) != count:
+        time.sleep(0.001)
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_scheduler_priority():
+    """Test interactive lookups go first and bulk keeps to its share"""
+    shares = {INTERACTIVE: 1.0, BULK: 0.5}
+    scheduler = LookupScheduler("upstream", slots=2, shares=shares)
+    order = []
+
+    def lookup(priority):
+        with scheduler.slot(priority):
+            order.append(priority)
+
+    scheduler.acquire(BULK)
+    bulk = threading.Thread(target=lookup, args=(BULK,))
+    bulk.start()
+    wait_queued(scheduler, BULK, 1)
+    # the second slot is kept for interactive lookups
+    scheduler.acquire(INTERACTIVE)
+    interactive = threading.Thread(target=lookup, args=(INTERACTIVE,))
+    interactive.start()
+    wait_queued(scheduler, INTERACTIVE, 1)
+
+    scheduler.release(BULK)
+    interactive.join()
+    bulk.join()
+    assert order == [INTERACTIVE, BULK]
+    scheduler.release(INTERACTIVE)
+
+    counters = METRICS.snapshot()["counters"]
+    assert counters["scheduler.upstream.bulk.lookups"] == 2
+    assert counters["scheduler.upstream.interactive.lookups"] == 2
+    assert counters["scheduler.upstream.bulk.wait_ms"] >= 0
+
+
+@patch("refparse.parser.requests.get")
+def test_lookup_priority(mock_get):
+    """Test the lookups are scheduled in the priority class of the thread"""
+    mock_get.return_value = Mock(ok=False, status_code=404, headers={})
+    assert current_priority() == INTERACTIVE
+    with lookup_priority(BULK):
+        CrossRefParser("10.1021/missing")
+    assert current_priority() == INTERACTIVE
+    CrossRefParser("10.1021/missing")
+
+    counters = METRICS.snapshot()["counters"]
+    assert counters["scheduler.dx.doi.org.bulk.lookups"] == 1
+    assert counters["scheduler.dx.doi.org.interactive.lookups"] == 1
+
+
+def test_daemon_shares_schedulers(tmp_path):
+    """Test another process waits for the slots of the daemon"""
+    path = str(tmp_path / "refparse.sock")
+    server = RefDaemon(path, lambda: {})
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    scheduler = SCHEDULERS["upstream"] = LookupScheduler("upstream", 1)
+    scheduler.acquire(INTERACTIVE)
+    try:
+        batch = subprocess.Popen(
+            [sys.executable, "-c", BATCH, path],
+            cwd=ROOT,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        # the batch queues behind the interactive lookup of the daemon
+        wait_until(
+            lambda: METRICS.snapshot()["gauges"].get(
+                "scheduler.upstream.bulk.queued"
+            )
+            == 1
+        )
+        assert batch.poll() is None
+        scheduler.release(INTERACTIVE)
+        assert batch.communicate(timeout=10)[0] == "granted\n"
+        # the slot is released with the connection
+        wait_until(lambda: not scheduler.running[BULK])
+        counters = METRICS.snapshot()["counters"]
+        assert counters["scheduler.upstream.bulk.lookups"] == 1
+    finally:
+        send_request({"op": "shutdown"}, path)
+        thread.join()
+        server.server_close()
+
+
+def test_share_without_daemon(tmp_path):
+    """Test the schedulers of the process are used without a daemon"""
+    share_schedulers(str(tmp_path / "none.sock"))
+    with upstream_slot("https://upstream/works"):
+        pass
+    counters = METRICS.snapshot()["counters"]
+    assert counters["scheduler.upstream.interactive.lookups"] == 1
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.store import RecordStore
+from refparse.api import RefAPI
+from unittest.mock import patch, Mock
+import os
+
+curpath = os.path.dirname(os.path.realpath(__file__))
+with open(os.path.join(curpath, "crossref_test_example.xml"), "r") as f:
+    DOI_XML = f.read()
+
+CONFIG = {"doc": "$author[0][0] $online_year"}
+
+
+def test_search(tmp_path):
+    """Test full-text search ranks the records"""
+    store = RecordStore(str(tmp_path / "records.sqlite"))
+    store.save(
+        "10.1/a",
+        "crossref",
+        {
+            "title": "Perovskite solar cells",
+            "abstract": "Perovskite films and perovskite alloys",
+            "author": [["Marohn", "John A."]],
+            "journal_full_title": "The Journal of Physical Chemistry C",
+        },
+    )
+    store.save(
+        "1807.01219",
+        "arXiv",
+        {"title": "String junctions", "abstract": "A perovskite remark"},
+    )
+    store.save("10.1/B", "crossref", {"title": "Perovskite"})
+    # replaced records are replaced in the search index
+    store.save("10.1/b", "crossref", {"title": "Silicon", "author": []})
+
+    assert len(store) == 3
+    assert [r[0] for r in store.search("perovskite")] == [
+        "10.1/a",
+        "1807.01219",
+    ]
+    assert [r[0] for r in store.search("author:marohn")] == ["10.1/a"]
+    assert [r[0] for r in store.search("chemistry")] == ["10.1/a"]
+    assert store.search("silicon")[0][:2] == ("10.1/b", "crossref")
+
+    (api,) = store.search_api("junction*", CONFIG)
+    assert api.parser.parsed["arXiv ID"] == "1807.01219"
+
+
+@patch("refparse.parser.requests.get")
+def test_api_store(mock_get, tmp_path):
+    """Test RefAPI saves resolved records and loads them later"""
+    mock_get.return_value.ok = True
+    mock_get.return_value.text = DOI_XML
+    mock_get.return_value.headers = {}
+    store = RecordStore(str(tmp_path / "records.sqlite"))
+
+    api = RefAPI("10.1021/acs.jpcc.8b11783", CONFIG, store=store)
+    stored = RefAPI("10.1021/ACS.JPCC.8B11783", CONFIG, store=store)
+
+    assert mock_get.call_count == 1
+    assert stored.render("doc") == api.render("doc") == "Tirmzi 2019"
+    assert stored.parser.parsed["doi"] == "10.1021/ACS.JPCC.8B11783"
+    assert store.search("photoconductivity")[0][0] == (
+        "10.1021/acs.jpcc.8b11783"
+    )
+
+
+@patch("refparse.parser.requests.get")
+def test_api_store_fields(mock_get, tmp_path):
+    """Test a record parsed with selected fields serves only those"""
+    mock_get.return_value = Mock(ok=True, text=DOI_XML, headers={})
+    store = RecordStore(str(tmp_path / "records.sqlite"))
+    fields = {"author", "online_year"}
+
+    RefAPI("10.1021/acs.jpcc.8b11783", CONFIG, store=store, fields=fields)
+    entry = store.entry("10.1021/acs.jpcc.8b11783", "crossref", fields)
+    assert entry["fields"] == fields
+    assert store.lookup("10.1021/acs.jpcc.8b11783", "crossref") is None
+    assert not store.records()
+    api = RefAPI(
+        "10.1021/acs.jpcc.8b11783", CONFIG, store=store, fields={"author"}
+    )
+    assert api.render("doc") == "Tirmzi 2019"
+    assert mock_get.call_count == 1
+
+    # all fields are requested, the complete record replaces it
+    RefAPI("10.1021/acs.jpcc.8b11783", CONFIG, store=store)
+    assert mock_get.call_count == 2
+    RefAPI("10.1021/acs.jpcc.8b11783", CONFIG, store=store, fields=fields)
+    assert mock_get.call_count == 2
+    assert len(store.records()) == 1
+
+
+@patch("refparse.parser.requests.get")
+def test_api_revalidate(mock_get, tmp_path):
+    """Test stale records are revalidated with conditional requests"""
+    mock_get.return_value = Mock(
+        ok=True,
+        status_code=200,
+        text=DOI_XML,
+        headers={"ETag": '"v1"', "Last-Modified": "Thu, 16 Jan 2020"},
+    )
+    store = RecordStore(str(tmp_path / "records.sqlite"))
+    RefAPI("10.1021/acs.jpcc.8b11783", CONFIG, store=store)
+    entry = store.entry("10.1021/acs.jpcc.8b11783", "crossref")
+    assert entry["validators"] == {
+        "etag": '"v1"',
+        "last_modified": "Thu, 16 Jan 2020",
+    }
+
+    # fresh records are not requested
+    RefAPI("10.1021/acs.jpcc.8b11783", CONFIG, store=store, max_age=60)
+    assert mock_get.call_count == 1
+
+    # not modified, the stored record is used without parsing
+    mock_get.return_value = Mock(ok=True, status_code=304, text="")
+    with patch("refparse.parser.CrossRefParser.parse_api") as mock_parse:
+        api = RefAPI(
+            "10.1021/acs.jpcc.8b11783", CONFIG, store=store, max_age=0
+        )
+        assert not mock_parse.called
+    assert mock_get.call_args[1]["headers"]["If-None-Match"] == '"v1"'
+    assert mock_get.call_args[1]["headers"]["If-Modified-Since"] == (
+        "Thu, 16 Jan 2020"
+    )
+    assert api.render("doc") == "Tirmzi 2019"
+    assert store.entry("10.1021/acs.jpcc.8b11783", "crossref")[
+        "updated"
+    ] > entry["updated"]
+    assert store.stale(60) == []
+
+    # failed requests use the stored record
+    mock_get.return_value = Mock(ok=False, status_code=504)
+    api = RefAPI("10.1021/acs.jpcc.8b11783", CONFIG, store=store, max_age=0)
+    assert api.render("doc") == "Tirmzi 2019"
+
+
+def test_forwarded_parse_skips_store():
+    """Test a parse forwarded to the daemon does not open the store"""
+    from refparse.refparse import parse_reference
+
+    response = {"status": True, "results": [["doc", "Tirmzi"]], "log": []}
+    with patch(
+        "refparse.refparse.send_request", return_value=response
+    ), patch("refparse.refparse.open_store") as mock_store:
+        results = parse_reference("10.1/a", ["doc"], True, store=True)
+    assert results == [["doc", "Tirmzi"]]
+    assert not mock_store.called
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.templates import FastTemplate, UnsupportedTemplate
+from refparse.api import compile_template, render_template
+from refparse.parser import CrossRefParser, CrossRefCSLParser, arXivParser
+from collections import defaultdict
+import pytest
+import yaml
+import os
+
+curpath = os.path.dirname(os.path.realpath(__file__))
+with open(os.path.join(curpath, "../refparse/config.yaml"), "r") as config:
+    CONFIG = yaml.load(config, Loader=yaml.SafeLoader)
+
+
+def fixture_records():
+    """Parsed fields of the test responses, with and without print info"""
+    doi = "10.1021/acs.jpcc.8b11783"
+    fixtures = [
+        (CrossRefParser, doi, "crossref_test_example.xml"),
+        (CrossRefCSLParser, doi, "csl_test_example.json"),
+        (arXivParser, "hep-th/9901001v3", "arXiv_test_example.xml"),
+    ]
+    records = []
+    for parser_class, reference, filename in fixtures:
+        with open(os.path.join(curpath, filename), "r") as f:
+            parsed = parser_class(reference, text=f.read()).parsed
+        records.append(parsed)
+        records.append(
+            defaultdict(str, parsed, has_print="", has_publication="")
+        )
+    return records
+
+
+@pytest.mark.parametrize("ref_format", sorted(CONFIG))
+def test_fast_template_parity(ref_format):
+    """Test the shipped formats are translated and render as Cheetah"""
+    fast = compile_template(CONFIG[ref_format])
+    cheetah = compile_template(CONFIG[ref_format], fast=False)
+    assert isinstance(fast, FastTemplate)
+    for parsed in fixture_records():
+        assert render_template(fast, parsed) == render_template(
+            cheetah, parsed
+        )
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "#for $name in $author\n$name\n#end for\n",
+        "$author[0]\n",
+        "$title.upper()\n",
+        "#set $x = [$n for n in $author]\n",
+        "#if has_print\n$title\n#end if\n",
+        "${title}\n",
+        "#set $respond = 1\n",
+        "$title#slurp\n",
+    ],
+)
+def test_unsupported_template(source):
+    """Test templates outside the subset are rendered by Cheetah"""
+    with pytest.raises(UnsupportedTemplate):
+        FastTemplate(source)
+    assert not isinstance(compile_template(source), FastTemplate)
+
+
+def test_fast_template_fallback():
+    """Test names that are not fields are rendered by Cheetah"""
+    template = compile_template("#set $n = $len\n$n $title\n")
+    assert isinstance(template, FastTemplate)
+    assert render_template(template, defaultdict(str, title="A")) == " A\n"
+    with pytest.raises(Exception):
+        render_template(template, {"title": "A"})
+    template = compile_template(
+        "#if $a\n#set $b = 'B'\n#else\n#set $c = 'C'\n#end if\n$b$c\n"
+    )
+    assert render_template(template, defaultdict(str, a=1)) == "B\n"
+    assert render_template(template, defaultdict(str, b=None)) == "C\n"
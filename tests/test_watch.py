@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.watch import BibWatcher, find_references
+from unittest.mock import patch, Mock
+import os
+
+curpath = os.path.dirname(os.path.realpath(__file__))
+with open(os.path.join(curpath, "crossref_test_example.xml"), "r") as f:
+    DOI_XML = f.read()
+
+CONFIG = {"doc": "$author[0][0] $online_year"}
+
+
+def test_find_references():
+    """Test DOIs and prefixed arXiv IDs are found in order"""
+    text = r"""
+    See \cite{a} (doi: 10.1021/acs.jpcc.8b11783). The model of
+    arXiv:hep-th/9901001 and arxiv: 1807.01219v2, but not 2019.12345.
+    % 10.1000/commented
+    50\% of 10.1021/acs.jpcc.8b11783 again, 10.1002/(SICI)1097-0118.
+    """
+    assert find_references(text) == [
+        "10.1021/acs.jpcc.8b11783",
+        "hep-th/9901001",
+        "1807.01219v2",
+        "10.1002/(SICI)1097-0118",
+    ]
+
+
+@patch("refparse.parser.requests.get")
+def test_incremental_update(mock_get, tmp_path):
+    """Test only changed files are rescanned and new references resolved"""
+    mock_get.return_value.ok = True
+    mock_get.return_value.text = DOI_XML
+    mock_get.return_value.status_code = 200
+    chapter1 = tmp_path / "chapter1.tex"
+    chapter1.write_text("intro 10.1021/acs.jpcc.8b11783.\n")
+    chapter2 = tmp_path / "sub" / "chapter2.tex"
+    chapter2.parent.mkdir()
+    chapter2.write_text("no references yet\n")
+    output = tmp_path / "references.bib"
+
+    watcher = BibWatcher(str(tmp_path), CONFIG, "doc", str(output))
+    assert watcher.update()
+    assert output.read_text() == "Tirmzi 2019\n"
+    assert mock_get.call_count == 1
+    assert not watcher.update()
+
+    with patch("refparse.watch.find_references") as mock_find:
+        mock_find.return_value = ["10.1021/acs.jpcc.8b11783", "10.1000/x"]
+        chapter2.write_text("new 10.1000/x and 10.1021/acs.jpcc.8b11783\n")
+        assert watcher.update()
+        # only the changed chapter is scanned
+        assert mock_find.call_count == 1
+    assert mock_get.call_count == 2
+    assert output.read_text() == "Tirmzi 2019\n\nTirmzi 2019\n"
+
+    chapter2.unlink()
+    assert watcher.update()
+    assert output.read_text() == "Tirmzi 2019\n"
+    assert mock_get.call_count == 2
+
+
+@patch("refparse.watch.time.monotonic")
+@patch("refparse.parser.requests.get")
+def test_retry_failed(mock_get, mock_time, tmp_path):
+    """Test a reference that failed to resolve is retried after a backoff"""
+    failed = Mock(ok=False, status_code=503, headers={})
+    found = Mock(ok=True, status_code=200, text=DOI_XML, headers={})
+    mock_get.side_effect = [failed, found]
+    mock_time.return_value = 100
+    (tmp_path / "main.tex").write_text("see 10.1021/acs.jpcc.8b11783\n")
+    output = tmp_path / "references.bib"
+
+    watcher = BibWatcher(str(tmp_path), CONFIG, "doc", str(output))
+    watcher.update()
+    assert "10.1021/acs.jpcc.8b11783" not in watcher.entries
+    mock_time.return_value += BibWatcher.RETRY_DELAY - 1
+    assert not watcher.update()
+    assert mock_get.call_count == 1
+
+    mock_time.return_value += 1
+    assert watcher.update()
+    assert mock_get.call_count == 2
+    assert output.read_text() == "Tirmzi 2019\n"
+    assert not watcher.failures
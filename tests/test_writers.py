@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from refparse.writers import AtomicWriter, OutputWriters
+import pytest
+import os
+
+
+def test_atomic_writer(tmp_path):
+    """Test the entries replace the target on commit"""
+    path = tmp_path / "refs.bib"
+    path.write_text("old\n")
+    os.chmod(path, 0o640)
+
+    with AtomicWriter(str(path), sync_every=2) as writer:
+        writer.write("@article{a}")
+        writer.write("@article{b}\n")
+        writer.write("@article{c}")
+        # the target is unchanged until the commit
+        assert path.read_text() == "old\n"
+
+    assert path.read_text() == "@article{a}\n\n@article{b}\n\n@article{c}\n"
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    assert os.listdir(tmp_path) == ["refs.bib"]
+
+
+def test_atomic_writer_abort(tmp_path):
+    """Test a failure keeps the old target and removes the temporary file"""
+    path = tmp_path / "refs.bib"
+    path.write_text("old\n")
+
+    with pytest.raises(KeyboardInterrupt):
+        with AtomicWriter(str(path)) as writer:
+            writer.write("@article{a}")
+            raise KeyboardInterrupt
+
+    assert path.read_text() == "old\n"
+    assert os.listdir(tmp_path) == ["refs.bib"]
+
+
+def test_output_writers(tmp_path):
+    """Test only the formats with an output file are written"""
+    outputs = {"bibtex": str(tmp_path / "refs.bib")}
+    with OutputWriters(outputs) as writers:
+        writers.write([("bibtex", "@article{a}"), ("doc", "A 2019")])
+        writers.write([("bibtex", "@article{b}")])
+        assert "bibtex" in writers and "doc" not in writers
+
+    assert os.listdir(tmp_path) == ["refs.bib"]
+    assert (tmp_path / "refs.bib").read_text() == (
+        "@article{a}\n\n@article{b}\n"
+    )